@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+from metrics import series_columns
+from shared_cache import load_shared, save_shared
+
+
+# Metrics plotted on the org page that get derived series
+derived_metrics = series_columns
+
+ROLLING_WINDOW = 3
+
+# Years this many standard deviations from their cluster's mean are flagged on the charts
+ZSCORE_THRESHOLD = 2
+
+_derived_cache = {}
+
+
+def _zscore(frame):
+    values = frame[derived_metrics].astype(np.float64)
+    by_cluster = values.groupby([frame.index.get_level_values('org'), frame['Cluster']], observed=True)
+    return (values - by_cluster.transform('mean')) / by_cluster.transform('std').replace(0, np.nan)
+
+
+def _derive(frame, window):
+    # frame is (org, Year)-indexed and sorted; every statistic is one grouped, vectorized pass
+    values = frame[derived_metrics].astype(np.float64)
+    by_org = values.groupby(level='org', observed=True)
+
+    rolling_mean = by_org.rolling(window, min_periods=1).mean().droplevel(0)
+    rolling_std = by_org.rolling(window, min_periods=2).std().droplevel(0)
+    previous = by_org.shift(1)
+    yoy = (values - previous) / previous.abs().replace(0, np.nan)
+
+    return pd.concat({
+        'rolling_mean': rolling_mean,
+        'rolling_std': rolling_std,
+        'yoy': yoy,
+        'zscore': _zscore(frame),
+    }, axis=1)
+
+
+def _cagr(frame):
+    # Compound annual growth between the first and last year of each (org, Cluster) group
+    values = frame[derived_metrics].astype(np.float64).reset_index()
+    values['Cluster'] = frame['Cluster'].to_numpy()
+    grouped = values.groupby(['org', 'Cluster'], observed=True)
+    first = grouped.first()
+    last = grouped.last()
+    span = (last['Year'] - first['Year']).astype(np.float64).replace(0, np.nan)
+    ratio = last[derived_metrics] / first[derived_metrics]
+    # Growth rates are undefined when either end is zero or negative
+    ratio = ratio.where((first[derived_metrics] > 0) & (last[derived_metrics] > 0))
+    return ratio.pow(1 / span, axis=0) - 1
+
+
+def compute_derived(all_data, window=ROLLING_WINDOW):
+    frame = all_data.sort_index()
+    return {'series': _derive(frame, window), 'cagr': _cagr(frame), 'window': window}
+
+
+def append_years(derived, all_data, new_index):
+    # Recompute only what new years can change: the rows of the affected organisations from their
+    # first new year on, and the z-scores/CAGR of those organisations
+    window = derived['window']
+    frame = all_data.sort_index()
+    new_index = pd.MultiIndex.from_tuples(list(new_index), names=['org', 'Year'])
+    orgs = new_index.get_level_values('org').unique()
+
+    series = derived['series']
+    pieces = []
+    for org in orgs:
+        org_rows = frame.loc[[org]]
+        years = org_rows.index.get_level_values('Year')
+        first_new = new_index[new_index.get_level_values('org') == org].get_level_values('Year').min()
+        # Every stored row from the first new year on is replaced, a backfilled year shifts the windows after it
+        stale = (series.index.get_level_values('org') == org) & (series.index.get_level_values('Year') >= first_new)
+        series = series[~stale]
+        # Rows before the first new year need no change, except as context for the rolling window
+        context = org_rows[years < first_new].tail(window)
+        recomputed = _derive(pd.concat([context, org_rows[years >= first_new]]), window)
+        pieces.append(recomputed[recomputed.index.get_level_values('Year') >= first_new])
+    series = pd.concat([series] + pieces).sort_index()
+
+    # z-scores depend on whole (org, Cluster) groups and the recomputed rows only saw the window context,
+    # so they are refreshed over every row of the affected organisations
+    for org in orgs:
+        org_rows = frame.loc[[org]]
+        series.loc[org_rows.index, 'zscore'] = _zscore(org_rows).to_numpy()
+
+    cagr = derived['cagr'].drop(list(orgs), level='org', errors='ignore')
+    cagr = pd.concat([cagr, _cagr(frame.loc[list(orgs)])]).sort_index()
+    return {'series': series, 'cagr': cagr, 'window': window}
+
+
+def added_years(previous, current):
+    # Rows current adds to previous, or None when an earlier row was changed or removed
+    columns = ['Cluster'] + derived_metrics
+    if not previous.index.isin(current.index).all():
+        return None
+    before = previous[columns].astype(np.float64)
+    after = current.loc[previous.index, columns].astype(np.float64)
+    if not before.equals(after):
+        return None
+    return current.index.difference(previous.index)
+
+
+def previous_derived():
+    # (data_version, frame, derived) last built in this process, or persisted by any worker before a restart
+    if _derived_cache:
+        return next(iter(_derived_cache.values()))
+    return load_shared('derived_series')
+
+
+def get_derived(store, data_version):
+    # Derived series for the loaded data, computed once per data version; a new version that only
+    # adds years extends the previous series instead of recomputing every organisation
+    if data_version not in _derived_cache:
+        previous = previous_derived()
+        if previous and previous[0] == data_version:
+            state = previous
+        else:
+            all_data = store.long_frame(['Cluster'] + derived_metrics)
+            new_index = added_years(previous[1], all_data) if previous else None
+            if new_index is None:
+                derived = compute_derived(all_data)
+            elif len(new_index):
+                derived = append_years(previous[2], all_data, new_index)
+            else:
+                derived = previous[2]
+            state = (data_version, all_data, derived)
+            save_shared('derived_series', state)
+        _derived_cache.clear()
+        _derived_cache[data_version] = state
+    return _derived_cache[data_version][2]
+
+
+def derived_for(derived, org, years):
+    # Rows of one organisation for the given years, in year order
+    series = derived['series'].xs(org, level='org')
+    return series.reindex(sorted(set(int(y) for y in years)))
+
+
+def cagr_for(derived, org, clusters=None):
+    # Growth of each metric over the full history of the organisation's clusters
+    cagr = derived['cagr'].xs(org, level='org')
+    return cagr.loc[[c for c in cagr.index if c in clusters]] if clusters else cagr
+
+
+__all__ = ['derived_metrics', 'ROLLING_WINDOW', 'ZSCORE_THRESHOLD', 'compute_derived', 'append_years', 'added_years', 'get_derived',
+           'derived_for', 'cagr_for']
@@ -0,0 +1,136 @@
+import json
+import hashlib
+
+from flask import Blueprint, Response, request, jsonify, abort
+
+from data_loader import data_version
+from storage import store
+from benchmarks import get_benchmarks
+from analytics import get_derived, cagr_for
+from export import org_slugs, org_slug, parse_ints
+from metrics import series_columns, summary_columns, number, summary_metrics, json_safe
+
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+summary_fields = ['roa', 'nav_share', 'price_earnings', 'earnings_per_share_total', 'dividend_per_share_total',
+                  'debt_equity', 'cagr']
+
+
+def request_etag():
+    # Responses only change with the data, so the version plus the normalised query identifies them
+    query = sorted((k, v) for k, v in request.args.items(multi=True))
+    raw = json.dumps([data_version, request.path, query])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def cached_json(build):
+    # Answer repeat polls with 304 before doing any work
+    etag = request_etag()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    response = jsonify(json_safe(build()))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Data-Version'] = data_version
+    return response
+
+
+def resolve_org(slug):
+    if slug not in org_slugs:
+        abort(404, description=f"Unknown organisation: {slug}")
+    return org_slugs[slug]
+
+
+def parse_page():
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', DEFAULT_PER_PAGE))
+    except ValueError:
+        abort(400, description="page and per_page must be integers")
+    if page < 1 or not 1 <= per_page <= MAX_PER_PAGE:
+        abort(400, description=f"page must be >= 1 and per_page between 1 and {MAX_PER_PAGE}")
+    return page, per_page
+
+
+@api_bp.route('/orgs')
+def list_orgs():
+    def build():
+        orgs = []
+        for org in store.orgs():
+            clusters, years = store.clusters_and_years(org)
+            orgs.append({
+                'name': org,
+                'slug': org_slug(org),
+                'clusters': {str(int(cluster)): [int(y) for y in years[cluster]] for cluster in clusters},
+            })
+        return {'data_version': data_version, 'orgs': orgs}
+
+    return cached_json(build)
+
+
+@api_bp.route('/orgs/<slug>/metrics')
+def org_metrics(slug):
+    org = resolve_org(slug)
+    clusters = parse_ints(request.args.get('clusters'))
+    years = parse_ints(request.args.get('years'))
+    page, per_page = parse_page()
+
+    fields = [f for f in request.args.get('fields', '').split(',') if f]
+    unknown = [f for f in fields if f not in summary_fields + series_columns]
+    if unknown:
+        abort(400, description=f"Unknown fields: {', '.join(unknown)}")
+    wanted_summary = [f for f in fields if f in summary_fields] if fields else summary_fields
+    wanted_series = [f for f in fields if f in series_columns] if fields else series_columns
+
+    def build():
+        columns = list(dict.fromkeys(['Year', 'Cluster'] + summary_columns + series_columns))
+        df = store.select(org, columns, clusters, years)
+        result = {
+            'org': org,
+            'slug': slug,
+            'data_version': data_version,
+            'selection': {'clusters': clusters, 'years': years, 'rows': int(len(df))},
+        }
+        if wanted_summary:
+            summary = summary_metrics(df)
+            if 'cagr' in wanted_summary:
+                # Per cluster over its whole history, so the year filter does not apply
+                cagr = cagr_for(get_derived(store, data_version), org, clusters)
+                summary['cagr'] = {str(int(cluster)): row.to_dict() for cluster, row in cagr.iterrows()}
+            result['summary'] = {f: summary[f] for f in wanted_summary}
+        if wanted_series:
+            rows = df.sort_values('Year')[['Year', 'Cluster'] + wanted_series]
+            total = len(rows)
+            rows = rows.iloc[(page - 1) * per_page:page * per_page]
+            values = {f: rows[f].to_numpy() for f in wanted_series}
+            result['series'] = [
+                {'Year': int(year), 'Cluster': int(cluster), **{f: number(values[f][i]) for f in wanted_series}}
+                for i, (year, cluster) in enumerate(zip(rows['Year'], rows['Cluster']))
+            ]
+            result['pagination'] = {'page': page, 'per_page': per_page, 'total': total,
+                                    'pages': (total + per_page - 1) // per_page}
+        return result
+
+    return cached_json(build)
+
+
+@api_bp.route('/benchmarks')
+def industry_benchmarks():
+    def build():
+        benchmarks = get_benchmarks(store, data_version)
+        return {
+            'data_version': data_version,
+            'years': list(benchmarks['years']),
+            'overall': {k: number(v) for k, v in benchmarks['overall'].items()},
+        }
+
+    return cached_json(build)
+
+
+__all__ = ['api_bp']
@@ -0,0 +1,55 @@
+# Industry averages are taken over the most recent years of every organisation
+BENCHMARK_YEARS = 5
+
+benchmark_columns = {
+    'roa': 'InflationAdjustedReturn OnAssets',
+    'raw_roa': 'Return OnAssets',
+    'nav': 'NAVShare',
+    'pe': 'PriceEarnings',
+    'eps': 'ES',
+    'roe': 'InflationAdjustedROE',
+    'current_ratio': 'CurrentRatio',
+    'quick_ratio': 'QuickRatio',
+    'earnings_yield': 'EarningsYield',
+    'dividend_yield': 'DividendYield',
+}
+
+_benchmark_cache = {}
+
+
+def compute_benchmarks(all_data, years=BENCHMARK_YEARS):
+    # all_data is the stacked (org, Year) frame, so every aggregate is a single vectorized mean/groupby
+    combined = all_data[['Cluster'] + list(benchmark_columns.values())].reset_index()
+    combined = combined.rename(columns={v: k for k, v in benchmark_columns.items()})
+
+    recent = combined[combined['Year'] > combined['Year'].max() - years]
+
+    # Kept as numpy scalars, so the API still knows the means come from float32 columns
+    overall = recent[list(benchmark_columns)].mean()
+    return {
+        'overall': dict(zip(overall.index, overall.to_numpy())),
+        'by_year': combined.groupby('Year')[list(benchmark_columns)].mean(),
+        'by_cluster': combined.groupby('Cluster', observed=True)[list(benchmark_columns)].mean(),
+        'years': (int(recent['Year'].min()), int(recent['Year'].max())),
+    }
+
+
+def get_benchmarks(store, data_version):
+    # Computed once per data version, KPI cards and tooltips only read the cached values
+    if data_version not in _benchmark_cache:
+        _benchmark_cache.clear()
+        _benchmark_cache[data_version] = compute_benchmarks(
+            store.long_frame(['Cluster'] + list(benchmark_columns.values())))
+    return _benchmark_cache[data_version]
+
+
+def benchmark(store, data_version, metric, year=None, cluster=None):
+    benchmarks = get_benchmarks(store, data_version)
+    if year is not None:
+        return float(benchmarks['by_year'].loc[year, metric])
+    if cluster is not None:
+        return float(benchmarks['by_cluster'].loc[cluster, metric])
+    return float(benchmarks['overall'][metric])
+
+
+__all__ = ['BENCHMARK_YEARS', 'benchmark_columns', 'compute_benchmarks', 'get_benchmarks', 'benchmark']
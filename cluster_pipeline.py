@@ -0,0 +1,145 @@
+import os
+import json
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.cluster import MiniBatchKMeans
+
+from train_decision_tree import raw_data_file, load_training_frames
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+clusters_file = 'Clusters_Data.xlsx'
+state_file = 'cluster_state.json'
+
+N_CLUSTERS = 3
+
+# Refit an organisation when new years sit this much further from their centroids than the fitted data did
+DRIFT_THRESHOLD = 1.5
+
+
+def feature_matrix(df):
+    # Every ratio except Year, as floats; text cells and gaps fall back to the column median
+    features = df.drop(columns=['Year', 'Cluster'], errors='ignore').apply(pd.to_numeric, errors='coerce')
+    features = features.fillna(features.median()).fillna(0.0)
+    return list(features.columns), features.to_numpy(dtype=np.float64)
+
+
+def scale(X, mean, std):
+    return (X - mean) / std
+
+
+def distances(X_scaled, centroids):
+    # (rows, clusters) euclidean distances in one broadcast
+    return np.sqrt(((X_scaled[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2))
+
+
+def fit_org(org, df, n_clusters=N_CLUSTERS):
+    columns, X = feature_matrix(df)
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    std[std == 0] = 1.0
+    X_scaled = scale(X, mean, std)
+
+    model = MiniBatchKMeans(n_clusters=n_clusters, n_init=10, random_state=0)
+    labels = model.fit_predict(X_scaled)
+
+    # Cluster 0 is the largest group, which is the one the dashboard selects by default
+    order = np.argsort(-np.bincount(labels, minlength=n_clusters), kind='stable')
+    remap = np.empty(n_clusters, dtype=int)
+    remap[order] = np.arange(n_clusters)
+    labels = remap[labels]
+    centroids = model.cluster_centers_[order]
+
+    mean_distance = float(distances(X_scaled, centroids).min(axis=1).mean())
+    return {
+        'columns': columns,
+        'mean': mean.tolist(),
+        'std': std.tolist(),
+        'centroids': centroids.tolist(),
+        'mean_distance': mean_distance,
+        'labels': {str(int(year)): int(label) for year, label in zip(df['Year'], labels)},
+    }
+
+
+def update_org(org, df, state, drift_threshold=DRIFT_THRESHOLD, refit=False):
+    columns, X = feature_matrix(df)
+    if refit or state is None or state['columns'] != columns:
+        logger.info(f"{org}: fitting clusters from scratch")
+        return fit_org(org, df)
+
+    years = df['Year'].astype(int).astype(str).to_numpy()
+    new = ~np.isin(years, list(state['labels']))
+    if not new.any():
+        return state
+
+    # New years are assigned to the existing centroids with the stored scaling
+    X_new = scale(X[new], np.asarray(state['mean']), np.asarray(state['std']))
+    dist = distances(X_new, np.asarray(state['centroids']))
+    drift = float(dist.min(axis=1).mean() / state['mean_distance']) if state['mean_distance'] else np.inf
+
+    if drift > drift_threshold:
+        logger.info(f"{org}: drift {drift:.2f} above {drift_threshold}, refitting")
+        return fit_org(org, df)
+
+    logger.info(f"{org}: assigned {int(new.sum())} new years to existing clusters (drift {drift:.2f})")
+    state = dict(state)
+    state['labels'] = dict(state['labels'])
+    state['labels'].update({year: int(label) for year, label in zip(years[new], dist.argmin(axis=1))})
+    return state
+
+
+def load_state(path=state_file):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(state, path=state_file):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def write_clusters(frames, states, path=clusters_file):
+    # Same layout as the dashboard workbook: one sheet per organisation, raw ratios plus Cluster
+    tmp = f"{path}.tmp.xlsx"
+    with pd.ExcelWriter(tmp, engine='openpyxl') as writer:
+        for org, df in frames.items():
+            out = df.drop(columns=['Cluster'], errors='ignore').copy()
+            out['Cluster'] = out['Year'].astype(int).astype(str).map(states[org]['labels']).astype(int)
+            out.to_excel(writer, sheet_name=org, index=False)
+    os.replace(tmp, path)
+
+
+def run(path=raw_data_file, out=clusters_file, n_jobs=-1, refit=False, drift_threshold=DRIFT_THRESHOLD):
+    frames = load_training_frames(path)
+    state = load_state()
+
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(update_org)(org, df, state.get(org), drift_threshold, refit) for org, df in frames.items()
+    )
+    state.update(dict(zip(frames, results)))
+
+    write_clusters(frames, state, out)
+    save_state(state)
+    logger.info(f"Wrote clusters for {len(frames)} organisations to {out}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Derive the Cluster column from the raw ratios in Data.xlsx")
+    parser.add_argument('--data', default=raw_data_file)
+    parser.add_argument('--out', default=clusters_file)
+    parser.add_argument('--jobs', type=int, default=-1, help="Worker processes (-1 uses all cores)")
+    parser.add_argument('--refit', action='store_true', help="Re-cluster every organisation from scratch")
+    parser.add_argument('--drift-threshold', type=float, default=DRIFT_THRESHOLD)
+    args = parser.parse_args()
+    run(args.data, args.out, n_jobs=args.jobs, refit=args.refit, drift_threshold=args.drift_threshold)
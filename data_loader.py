@@ -0,0 +1,176 @@
+import os
+import sys
+import hashlib
+import logging
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from workbook_stream import stream_workbook, read_sheet, sheet_names_of, ingestion_report
+from metrics import series_columns, summary_columns
+from benchmarks import benchmark_columns
+
+
+logger = logging.getLogger(__name__)
+
+# Loading data
+excel_file = 'Clusters_Data.xlsx'
+
+# 'dashboard' keeps only the columns the pages read, 'full' loads every ratio up front
+load_profile = os.environ.get('DASHBOARD_LOAD_PROFILE', 'dashboard')
+
+# 'pandas' reads each sheet with pd.read_excel, 'streaming' iterates rows in read-only mode across worker processes
+loader = os.environ.get('DASHBOARD_LOADER', 'pandas')
+
+# 'pandas' serves the in-memory sheets, 'sqlite' queries an indexed database built from the workbook
+storage_backend = os.environ.get('DASHBOARD_STORAGE', 'pandas')
+
+dashboard_columns = ['Year', 'Cluster', 'EarningsYield', 'DividendYield', 'ES', 'DividendShare', 'QuickRatio',
+                     'CurrentRatio', 'InflationAdjustedROE', 'DebtEquity', 'NAVShare', 'PriceEarnings',
+                     'InflationAdjustedReturn OnAssets', 'Return OnAssets']
+
+# Columns behind the cards, benchmarks and derived series stay float64: float32 keeps each cell's two
+# decimals, but an average such as 14.105 comes out as 14.1049995 and the card shows 14.10
+averaged_columns = set(summary_columns) | set(benchmark_columns.values()) | set(series_columns)
+
+
+def file_version(path):
+    # Content hash of the workbook, used to key every cache built from it
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def compact_dtypes(df):
+    df = df.copy()
+    if 'Year' in df:
+        df['Year'] = df['Year'].astype('int16')
+    if 'Cluster' in df:
+        df['Cluster'] = df['Cluster'].astype('int8')
+
+    for column in df.columns.drop(['Year', 'Cluster'], errors='ignore'):
+        values = df[column]
+        if values.dtype == object:
+            values = pd.to_numeric(values, errors='coerce')
+        if values.dtype != np.float64 and values.dtype != np.int64:
+            df[column] = values
+            continue
+        if column in averaged_columns:
+            df[column] = values.astype(np.float64)
+            continue
+        # The workbook stores ratios to two decimals; only narrow when float32 still reproduces them
+        narrow = values.astype(np.float32)
+        same = np.isclose(narrow.astype(np.float64).round(2), values.round(2), rtol=0, atol=1e-9) | values.isna()
+        df[column] = narrow if same.all() else values.astype(np.float64)
+    return df
+
+
+def load_data(path=excel_file, profile=load_profile):
+    usecols = None if profile == 'full' else dashboard_columns
+    if loader == 'streaming':
+        names, frames = stream_workbook(path, usecols)
+        return names, {sheet: compact_dtypes(df) for sheet, df in frames.items()}
+
+    xls = pd.ExcelFile(path)
+    # Create a dictionary to store DataFrames for each organization
+    frames = {sheet: compact_dtypes(pd.read_excel(xls, sheet_name=sheet, usecols=usecols))
+              for sheet in xls.sheet_names}
+    return xls.sheet_names, frames
+
+
+@lru_cache(maxsize=None)
+def all_columns(path=excel_file):
+    # Header row only, so the full column list is known without loading the data
+    return tuple(pd.read_excel(path, sheet_name=0, nrows=0).columns)
+
+
+@lru_cache(maxsize=None)
+def full_frame(org, path=excel_file):
+    # Every column of one sheet, loaded the first time something asks for it
+    if loader == 'streaming':
+        return compact_dtypes(pd.DataFrame(read_sheet(path, org)[1]))
+    return compact_dtypes(pd.read_excel(path, sheet_name=org))
+
+
+def get_columns(org, columns):
+    df = dfs[org]
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        df = full_frame(org)
+    return df[list(columns)]
+
+
+def select_rows(df, clusters=None, years=None):
+    # The cluster/year filter shared by the charts and the data export
+    if clusters:
+        df = df[df['Cluster'].isin(clusters)]
+    if years:
+        df = df[df['Year'].isin(years)]
+    return df
+
+
+def build_long_frame(frames):
+    # All organisations stacked into one frame indexed by (org, Year), so cross-company
+    # queries are a single groupby instead of a loop over the dict
+    combined = pd.concat(frames, names=['org', None]).reset_index(level=0).reset_index(drop=True)
+
+    # A few cells are stored as text in the workbook; the stacked frame is numeric throughout
+    for column in combined.columns.drop(['org']):
+        if combined[column].dtype == object:
+            combined[column] = pd.to_numeric(combined[column], errors='coerce')
+
+    combined['org'] = pd.Categorical(combined['org'], categories=list(frames))
+    combined['Cluster'] = combined['Cluster'].astype('category')
+    combined['Year'] = combined['Year'].astype('int16')
+    return combined.set_index(['org', 'Year']).sort_index()
+
+
+@lru_cache(maxsize=None)
+def full_long_frame():
+    return build_long_frame({org: full_frame(org) for org in sheet_names})
+
+
+def get_long_frame(columns):
+    # The stacked frame restricted to columns, falling back to the lazily loaded full data
+    if all(column in all_data.columns for column in columns):
+        return all_data[list(columns)]
+    return full_long_frame()[list(columns)]
+
+
+def memory_report(path=excel_file):
+    xls = pd.ExcelFile(path)
+    rows = []
+    for sheet in xls.sheet_names:
+        full = pd.read_excel(xls, sheet_name=sheet)
+        pruned = compact_dtypes(full[dashboard_columns])
+        rows.append({
+            'org': sheet,
+            'full_bytes': int(full.memory_usage(deep=True).sum()),
+            'compact_full_bytes': int(compact_dtypes(full).memory_usage(deep=True).sum()),
+            'dashboard_bytes': int(pruned.memory_usage(deep=True).sum()),
+        })
+    report = pd.DataFrame(rows).set_index('org')
+    report.loc['Total'] = report.sum()
+    report['saving'] = 1 - report['dashboard_bytes'] / report['full_bytes']
+    return report
+
+
+data_version = file_version(excel_file)
+if storage_backend == 'sqlite':
+    # Every read goes through the database, so the sheets are never held in memory
+    sheet_names, dfs, all_data = sheet_names_of(excel_file), None, None
+else:
+    sheet_names, dfs = load_data()
+    all_data = build_long_frame(dfs)
+    logger.info(f"Loaded {len(dfs)} sheets from {excel_file} (data version {data_version}, profile {load_profile}, "
+                f"{loader} loader)")
+
+
+if __name__ == '__main__':
+    if '--ingestion' in sys.argv:
+        print(ingestion_report(excel_file, None if load_profile == 'full' else dashboard_columns).to_string())
+    else:
+        print(memory_report().to_string())
@@ -1,10 +1,15 @@
 import os
 import json
+import hashlib
+from functools import lru_cache
+import numpy as np
 import plotly.graph_objs as go
 from dash import html, dcc
 import dash_bootstrap_components as dbc
 from dash import dash_table
 import pandas as pd
+from figure_encoding import encode_array, encode_figure
+from shared_cache import shared_cache
 
 
 def load_decision_tree_results():
@@ -23,6 +28,49 @@ def load_decision_tree_results():
 
 decision_tree_results = load_decision_tree_results()
 
+# Identifies the trained models, so cached tables and predictions are dropped when they are retrained
+model_version = hashlib.sha256(json.dumps(decision_tree_results, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def split_features(node):
+    if 'class' in node:
+        return []
+    return [node['feature']] + split_features(node['left']) + split_features(node['right'])
+
+
+def model_features(org_data):
+    # Every feature the tree needs an input for; some results files split on names
+    # that are missing from feature_importance
+    features = list(org_data['feature_importance'].keys())
+    for feature in split_features(org_data['tree_structure']):
+        if feature not in features:
+            features.append(feature)
+    return features
+
+
+def model_classes(org_data):
+    # Order of the leaf probabilities; older results files only list the labels in the classification report
+    if 'classes' in org_data:
+        return org_data['classes']
+    return sorted(k for k in org_data['classification_report'] if k not in ('accuracy', 'macro avg', 'weighted avg'))
+
+
+def ranked_surface_features(org_data):
+    # Features the tree splits on come first, root split first, then the rest by importance.
+    # Importance alone can rank them last when the results file does not list them
+    importance = org_data['feature_importance']
+    splits = list(dict.fromkeys(split_features(org_data['tree_structure'])))
+    rest = sorted((f for f in model_features(org_data) if f not in splits),
+                  key=lambda feature: importance.get(feature, 0.0), reverse=True)
+    return splits + rest
+
+
+def eps_threshold_text(selected_org):
+    # The tree labels HIGH/LOW at the EPS it was trained against, which is stored with its results
+    if selected_org not in decision_tree_results:
+        return ""
+    return f"Industry Average Earnings per share is R{decision_tree_results[selected_org]['eps_threshold']:.2f}"
+
 
 def create_decision_tree_controls():
     return html.Div([
@@ -47,6 +95,19 @@ def create_decision_tree_controls():
                 dbc.Button("Reset", id="reset-button", color="custom")
             ])
         ]),
+        dbc.Row([
+            dbc.Col(dbc.Checklist(
+                id="uncertainty-mode",
+                options=[{"label": "Estimate uncertainty (Monte Carlo)", "value": "on"}],
+                value=[],
+                switch=True
+            ), width="auto"),
+            dbc.Col(dbc.InputGroup([
+                dbc.InputGroupText("Input noise ±"),
+                dbc.Input(id="uncertainty-noise", type="number", value=DEFAULT_NOISE * 100, min=0, step="any"),
+                dbc.InputGroupText("%")
+            ], size="sm"), width=3)
+        ], className="mt-2"),
         html.Div(id="prediction-output", className="mt-3"),
         html.Span(
             "ⓘ",
@@ -60,11 +121,19 @@ def create_decision_tree_controls():
             }
         ),
         dbc.Tooltip(
-            "Industry Average Earnings per share is R200.42",
+            eps_threshold_text("African Overseas Enterprises"),
+            id="eps-threshold-tooltip",
             target="info-icon",
             placement="right"),
         html.Div(id="decision-table-container"),
         html.Br(),
+        html.H4("Decision Surface"),
+        dbc.Row([
+            dbc.Col(dcc.Dropdown(id="surface-x-feature", placeholder="X axis feature", clearable=False), width=3),
+            dbc.Col(dcc.Dropdown(id="surface-y-feature", placeholder="Y axis feature", clearable=False), width=3),
+        ], className="mb-2"),
+        dcc.Graph(id="decision-surface", config={'displayModeBar': False}),
+        html.Br(),
         html.P(" LOW : EPS lower than industry average.", style={'font-weight':'bold', 'color':'red'}),
         html.P("HIGH : EPS higher than industry average.", style={'font-weight':'bold', 'color':'green'})
     ])
@@ -75,7 +144,7 @@ def create_feature_inputs(selected_org):
         return []
 
     org_data = decision_tree_results[selected_org]
-    features = list(org_data['feature_importance'].keys())
+    features = model_features(org_data)
 
     return [
         dbc.Col([
@@ -91,6 +160,7 @@ def create_feature_inputs(selected_org):
     ]
 
 
+@shared_cache('decision_table', model_version)
 def create_decision_table(tree_structure):
     def traverse_tree(node, path=None):
         if path is None:
@@ -167,6 +237,161 @@ def predict_class(node, feature_values):
         return predict_class(node['right'], feature_values)
 
 
-__all__ = ['load_decision_tree_results', 'decision_tree_results',
+def predict_class_vectorized(node, feature_values):
+    # Same walk as predict_class, but pushes whole arrays down the tree by splitting index sets
+    n = len(next(iter(feature_values.values())))
+    predictions = np.empty(n, dtype=object)
+
+    def walk(node, idx):
+        if 'class' in node:
+            predictions[idx] = node['class']
+            return
+        goes_left = feature_values[node['feature']][idx] <= node['threshold']
+        walk(node['left'], idx[goes_left])
+        walk(node['right'], idx[~goes_left])
+
+    walk(node, np.arange(n))
+    return predictions
+
+
+# Samples per uncertainty estimate, and the default input noise as a standard deviation relative to each value
+MC_SAMPLES = 100_000
+DEFAULT_NOISE = 0.1
+
+
+def leaf_probabilities_vectorized(node, feature_values, classes):
+    # Leaf value arrays follow classes; a tree trained on LOW years only has no HIGH probability at all
+    high = classes.index('HIGH') if 'HIGH' in classes else None
+    n = len(next(iter(feature_values.values())))
+    p_high = np.empty(n)
+    is_high = np.empty(n, dtype=bool)
+
+    def walk(node, idx):
+        if 'class' in node:
+            p_high[idx] = node['value'][high] if high is not None else 0.0
+            is_high[idx] = node['class'] == 'HIGH'
+            return
+        goes_left = feature_values[node['feature']][idx] <= node['threshold']
+        walk(node['left'], idx[goes_left])
+        walk(node['right'], idx[~goes_left])
+
+    walk(node, np.arange(n))
+    return p_high, is_high
+
+
+@shared_cache('prediction_uncertainty', model_version)
+def monte_carlo_prediction(selected_org, feature_values, noise=DEFAULT_NOISE, samples=MC_SAMPLES, seed=0):
+    org_data = decision_tree_results[selected_org]
+    tree = org_data['tree_structure']
+    features = model_features(org_data)
+    point = np.array([float(feature_values[f]) for f in features])
+
+    # Gaussian noise with a standard deviation of noise x |value|; inputs of zero get an absolute spread of noise.
+    # A fixed seed keeps the estimate stable for the same inputs, so it can be cached
+    scale = noise * np.where(point == 0, 1.0, np.abs(point))
+    draws = point + np.random.default_rng(seed).standard_normal((samples, len(features))) * scale
+    p_high, is_high = leaf_probabilities_vectorized(tree, {f: draws[:, i] for i, f in enumerate(features)},
+                                                    model_classes(org_data))
+
+    prediction = predict_class(tree, dict(zip(features, point)))
+    weighted_p_high = float(p_high.mean())
+    return {
+        'prediction': prediction,
+        'p_high': float(is_high.mean()),
+        'weighted_p_high': weighted_p_high,
+        # How strongly the leaves reached under noise back the call made on the entered values
+        'confidence': weighted_p_high if prediction == 'HIGH' else 1 - weighted_p_high,
+        'samples': samples,
+        'noise': noise,
+    }
+
+
+def tree_thresholds(node, feature):
+    if 'class' in node:
+        return []
+    own = [node['threshold']] if node['feature'] == feature else []
+    return own + tree_thresholds(node['left'], feature) + tree_thresholds(node['right'], feature)
+
+
+def surface_range(tree, feature, point=None):
+    # Span every split on the feature (and the user's point) with some padding either side
+    values = tree_thresholds(tree, feature)
+    if point is not None:
+        values.append(point)
+    if not values:
+        return 0.0, 1.0
+    low, high = min(values), max(values)
+    padding = max(abs(high - low) * 0.25, abs(high) * 0.25, 1.0)
+    return round(low - padding, 4), round(high + padding, 4)
+
+
+def decision_surface(selected_org, x_feature, y_feature, x_range, y_range, fixed_values, resolution=500):
+    if x_feature == y_feature:
+        raise ValueError(f"The surface needs two different features, got {x_feature} on both axes")
+    tree = decision_tree_results[selected_org]['tree_structure']
+    xs = np.linspace(x_range[0], x_range[1], resolution)
+    ys = np.linspace(y_range[0], y_range[1], resolution)
+
+    # Row-major grid: y varies along rows, x along columns, matching go.Heatmap's z layout
+    columns = {feature: np.full(resolution * resolution, value) for feature, value in fixed_values}
+    columns[x_feature] = np.tile(xs, resolution)
+    columns[y_feature] = np.repeat(ys, resolution)
+
+    z = (predict_class_vectorized(tree, columns) == 'HIGH').astype(np.int8).reshape(resolution, resolution)
+    return xs, ys, z
+
+
+@lru_cache(maxsize=256)
+def encoded_decision_surface(selected_org, x_feature, y_feature, x_range, y_range, fixed_values, resolution=500):
+    # Cached already in the binary form sent to the browser, so redraws skip both the grid and the encoding
+    xs, ys, z = decision_surface(selected_org, x_feature, y_feature, x_range, y_range, fixed_values, resolution)
+    return encode_array(xs), encode_array(ys), encode_array(z)
+
+
+def create_decision_surface_figure(selected_org, x_feature, y_feature, feature_values, resolution=500):
+    tree = decision_tree_results[selected_org]['tree_structure']
+    features = model_features(decision_tree_results[selected_org])
+
+    # Features that are not on an axis are held at the entered value, or 0 when left blank
+    fixed_values = tuple((f, float(feature_values.get(f) or 0.0)) for f in features
+                         if f not in (x_feature, y_feature))
+    x_range = surface_range(tree, x_feature, feature_values.get(x_feature))
+    y_range = surface_range(tree, y_feature, feature_values.get(y_feature))
+
+    xs, ys, z = encoded_decision_surface(selected_org, x_feature, y_feature, x_range, y_range, fixed_values,
+                                         resolution)
+
+    fig = go.Figure(go.Heatmap(
+        zmin=0, zmax=1,
+        colorscale=[[0, 'rgba(220, 53, 69, 0.45)'], [1, 'rgba(40, 167, 69, 0.45)']],
+        colorbar=dict(tickvals=[0, 1], ticktext=['LOW', 'HIGH']),
+        hovertemplate=f"{x_feature}: %{{x:.2f}}<br>{y_feature}: %{{y:.2f}}<extra></extra>"
+    ))
+
+    if feature_values.get(x_feature) is not None and feature_values.get(y_feature) is not None:
+        fig.add_trace(go.Scatter(
+            x=[feature_values[x_feature]], y=[feature_values[y_feature]],
+            mode='markers',
+            marker=dict(size=14, color='#09124f', symbol='x'),
+            name='Your input'
+        ))
+
+    fig.update_layout(
+        title={'text': f'{selected_org}<br>Predicted EPS class', 'x': 0.5, 'xanchor': 'center'},
+        xaxis_title=x_feature,
+        yaxis_title=y_feature,
+        template='plotly_white',
+        showlegend=False,
+        height=500
+    )
+    figure = encode_figure(fig)
+    figure['data'][0].update(x=xs, y=ys, z=z)
+    return figure
+
+
+__all__ = ['load_decision_tree_results', 'decision_tree_results', 'model_version', 'model_features', 'model_classes',
+           'ranked_surface_features', 'eps_threshold_text',
            'create_decision_tree_controls', 'create_decision_table', 'create_decision_table_component',
-           'predict_class']
\ No newline at end of file
+           'predict_class', 'predict_class_vectorized', 'MC_SAMPLES', 'DEFAULT_NOISE',
+           'leaf_probabilities_vectorized', 'monte_carlo_prediction', 'decision_surface', 'encoded_decision_surface',
+           'create_decision_surface_figure']
\ No newline at end of file
@@ -0,0 +1,160 @@
+import io
+import os
+import csv
+import tempfile
+from urllib.parse import urlencode
+
+from flask import Blueprint, Response, request, abort
+
+from data_loader import excel_file, sheet_names, all_columns, select_rows
+from workbook_stream import iter_sheet
+
+
+export_bp = Blueprint('export', __name__)
+
+# Rows written per chunk; only one chunk of formatted output is held at a time
+CHUNK_ROWS = 5000
+
+export_formats = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def org_slug(org):
+    # Same slug the navbar links use
+    return org.replace(' ', '-').replace('&', '').lower()
+
+
+org_slugs = {org_slug(org): org for org in sheet_names}
+
+
+def export_links(org_path, clusters, years):
+    # Download URLs for the current selection on an org page, one per format
+    query = {'orgs': org_path.strip('/')}
+    if clusters:
+        query['clusters'] = ','.join(str(c) for c in clusters)
+    if years:
+        query['years'] = ','.join(str(y) for y in years)
+    return {fmt: f"/export/{fmt}?{urlencode(query)}" for fmt in export_formats}
+
+
+def parse_ints(value):
+    if not value:
+        return []
+    try:
+        return [int(v) for v in value.split(',') if v != '']
+    except ValueError:
+        abort(400, description=f"Invalid list of integers: {value}")
+
+
+integer_columns = ['Year', 'Cluster']
+
+
+def export_columns():
+    return ['Organisation'] + list(all_columns())
+
+
+def selection_chunks(orgs, clusters, years, columns):
+    # Reads each sheet in CHUNK_ROWS batches straight from the workbook, so an export never
+    # loads (or leaves cached) a whole sheet; every chunk has exactly the export columns
+    for org in orgs:
+        for batch in iter_sheet(excel_file, org, batch_rows=CHUNK_ROWS):
+            chunk = select_rows(batch, clusters, years)
+            if not len(chunk):
+                continue
+            chunk = chunk.assign(Organisation=org).reindex(columns=columns)
+            for column in integer_columns:
+                if column in chunk and chunk[column].notna().all():
+                    chunk[column] = chunk[column].astype('int64')
+            yield chunk
+
+
+def stream_csv(columns, chunks):
+    # The header goes out first, so an empty selection is still a valid CSV
+    header = io.StringIO()
+    csv.writer(header, lineterminator='\n').writerow(columns)
+    yield header.getvalue()
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=False)
+
+
+def stream_file(path, block_size=1 << 16):
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            yield block
+
+
+def write_xlsx(columns, chunks, path):
+    from openpyxl import Workbook
+
+    # Write-only mode streams rows to disk instead of building the cell object model
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Selection')
+    ws.append(columns)
+    for chunk in chunks:
+        for row in chunk.itertuples(index=False, name=None):
+            ws.append([None if v != v else v for v in row])
+    wb.save(path)
+
+
+def write_parquet(columns, chunks, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # The schema comes from the column list, so an empty selection still writes a valid file
+    schema = pa.schema([(c, pa.string() if c == 'Organisation' else pa.int64() if c in integer_columns
+                         else pa.float64()) for c in columns])
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            # One row group per chunk
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+@export_bp.route('/export/<fmt>')
+def export_selection(fmt):
+    if fmt not in export_formats:
+        abort(404, description=f"Unsupported export format: {fmt}")
+
+    slugs = [s for s in request.args.get('orgs', '').split(',') if s]
+    if slugs == ['all']:
+        orgs = list(sheet_names)
+    else:
+        unknown = [s for s in slugs if s not in org_slugs]
+        if not slugs or unknown:
+            abort(404, description=f"Unknown organisation: {', '.join(unknown) or '(none)'}")
+        orgs = [org_slugs[s] for s in slugs]
+
+    clusters = parse_ints(request.args.get('clusters'))
+    years = parse_ints(request.args.get('years'))
+    columns = export_columns()
+    chunks = selection_chunks(orgs, clusters, years, columns)
+    filename = f"{'-'.join(slugs)}_selection.{fmt}"
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+
+    if fmt == 'csv':
+        return Response(stream_csv(columns, chunks), mimetype=export_formats[fmt], headers=headers)
+
+    # xlsx and parquet need a seekable file, so they are written to a temp file and streamed back from disk
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        if fmt == 'xlsx':
+            write_xlsx(columns, chunks, path)
+        else:
+            try:
+                write_parquet(columns, chunks, path)
+            except ImportError:
+                abort(501, description="Parquet export needs pyarrow installed")
+    except BaseException:
+        os.remove(path)
+        raise
+    headers['Content-Length'] = str(os.path.getsize(path))
+    response = Response(stream_file(path), mimetype=export_formats[fmt], headers=headers)
+    # Runs when the response is closed, even if the client disconnects before the body is read
+    response.call_on_close(lambda: os.remove(path))
+    return response
+
+
+__all__ = ['export_bp', 'export_links', 'org_slug', 'CHUNK_ROWS']
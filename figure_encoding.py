@@ -0,0 +1,138 @@
+import json
+import time
+import base64
+import shutil
+import subprocess
+
+import numpy as np
+import plotly.graph_objs as go
+from plotly.io.json import to_json_plotly
+
+
+# The typed arrays plotly.js decodes from {dtype, bdata}; there is no 64-bit integer type
+integer_dtypes = [np.int8, np.uint8, np.int16, np.uint16, np.int32, np.uint32]
+float_dtypes = {np.dtype(np.float32): 'f4', np.dtype(np.float64): 'f8'}
+
+
+def typed_dtype(array):
+    if array.dtype.kind in 'iu':
+        if not len(array):
+            return np.dtype(np.int8)
+        low, high = array.min(), array.max()
+        for dtype in integer_dtypes:
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                return np.dtype(dtype)
+        return np.dtype(np.float64)
+    if array.dtype in float_dtypes:
+        return array.dtype
+    if array.dtype.kind == 'f':
+        return np.dtype(np.float64)
+    return None
+
+
+def encode_array(values):
+    # Numeric arrays become plotly's binary array spec; anything else (text, dates) is left alone
+    array = np.asarray(values)
+    dtype = typed_dtype(array)
+    if dtype is None:
+        return values
+    data = np.ascontiguousarray(array, dtype=dtype.newbyteorder('<'))
+    spec = {'dtype': float_dtypes.get(dtype) or dtype.str.lstrip('<>|'), 'bdata': base64.b64encode(data).decode()}
+    if data.ndim > 1:
+        spec['shape'] = ','.join(str(n) for n in data.shape)
+    return spec
+
+
+def encode_arrays(value):
+    if isinstance(value, np.ndarray):
+        return encode_array(value)
+    if isinstance(value, dict):
+        return {k: encode_arrays(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_arrays(v) for v in value]
+    return value
+
+
+def encode_figure(fig):
+    # Figure as the plain dict dcc.Graph accepts, with every numeric trace array binary encoded
+    figure = fig.to_plotly_json()
+    return {'data': [encode_arrays(trace) for trace in figure['data']], 'layout': figure['layout']}
+
+
+_parse_script = """
+const payloads = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+const typed = {i1: Int8Array, u1: Uint8Array, i2: Int16Array, u2: Uint16Array, i4: Int32Array, u4: Uint32Array,
+               f4: Float32Array, f8: Float64Array};
+function decode(value) {
+  if (Array.isArray(value)) return value.map(decode);
+  if (value && typeof value === 'object') {
+    if (typeof value.bdata === 'string' && typed[value.dtype]) {
+      const bytes = Buffer.from(value.bdata, 'base64');
+      return new typed[value.dtype](bytes.buffer, bytes.byteOffset, bytes.length / typed[value.dtype].BYTES_PER_ELEMENT);
+    }
+    for (const k in value) value[k] = decode(value[k]);
+  }
+  return value;
+}
+const result = {};
+for (const [name, text] of Object.entries(payloads)) {
+  const runs = [];
+  for (let i = 0; i < 20; i++) {
+    const start = process.hrtime.bigint();
+    decode(JSON.parse(text));
+    runs.push(Number(process.hrtime.bigint() - start) / 1e6);
+  }
+  runs.sort((a, b) => a - b);
+  result[name] = runs[10];
+}
+console.log(JSON.stringify(result));
+"""
+
+
+def parse_times(payloads):
+    # Browser-side cost approximated with V8 in Node: JSON.parse plus the base64 to typed array step
+    node = shutil.which('node')
+    if node is None:
+        return {}
+    out = subprocess.run([node, '-e', _parse_script], input=json.dumps(payloads), capture_output=True, text=True,
+                         check=True)
+    return json.loads(out.stdout)
+
+
+def encoding_report(figures, repeat=20):
+    rows = []
+    payloads = {}
+    for name, fig in figures.items():
+        for encoding, build in (('json', lambda: fig), ('binary', lambda: encode_figure(fig))):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                text = to_json_plotly(build())
+            rows.append({'figure': name, 'encoding': encoding, 'bytes': len(text),
+                         'encode_ms': (time.perf_counter() - start) / repeat * 1000})
+            payloads[f'{name}/{encoding}'] = text
+    parsed = parse_times(payloads)
+    for row in rows:
+        row['parse_ms'] = parsed.get(f"{row['figure']}/{row['encoding']}")
+    return rows
+
+
+def sample_figures(points=(30, 10000, 250000)):
+    rng = np.random.default_rng(0)
+    figures = {}
+    for n in points:
+        figures[f'line {n}'] = go.Figure(go.Scatter(x=np.arange(n, dtype=np.int16 if n < 30000 else np.int32),
+                                                    y=rng.normal(size=n).astype(np.float32)))
+    return figures
+
+
+if __name__ == '__main__':
+    # python figure_encoding.py compares JSON lists with binary arrays for a few series sizes
+    rows = encoding_report(sample_figures())
+    print(f"{'figure':<14} {'encoding':<8} {'bytes':>10} {'encode ms':>10} {'parse ms':>9}")
+    for row in rows:
+        parse = f"{row['parse_ms']:.2f}" if row['parse_ms'] is not None else 'n/a'
+        print(f"{row['figure']:<14} {row['encoding']:<8} {row['bytes']:>10} {row['encode_ms']:>10.2f} {parse:>9}")
+
+
+__all__ = ['encode_array', 'encode_arrays', 'encode_figure', 'encoding_report']
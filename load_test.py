@@ -0,0 +1,212 @@
+import sys
+import time
+import random
+import argparse
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+
+org_paths = ['/african-overseas-enterprises', '/mr-price-group-ltd', '/rex-trueform-group-ltd',
+             '/the-foschini-group-ltd', '/truworths-international-ltd']
+
+
+class DashSession:
+    # One simulated analyst: a requests session that posts callbacks the way the browser renderer does
+
+    def __init__(self, base_url, dependencies, recorder, feature_counts):
+        self.base_url = base_url.rstrip('/')
+        self.http = requests.Session()
+        self.dependencies = dependencies
+        self.recorder = recorder
+        self.feature_counts = feature_counts
+
+    def get(self, label, path):
+        start = time.perf_counter()
+        r = self.http.get(self.base_url + path)
+        self.recorder.record(label, time.perf_counter() - start, r.status_code)
+        return r
+
+    def call(self, output, label, inputs, state=(), changed=None, pattern_outputs=None):
+        dependency = self.dependencies[output]
+
+        def prop(spec, value):
+            # Pattern-matching props are sent as a list of concrete (id, value) pairs
+            if spec['id'].startswith('{'):
+                return [{'id': i, 'property': spec['property'], 'value': v} for i, v in value]
+            return {'id': spec['id'], 'property': spec['property'], 'value': value}
+
+        outputs = []
+        for part in output.strip('.').split('...') if output.startswith('..') else [output]:
+            component_id, property_name = part.rsplit('.', 1)
+            if component_id.startswith('{'):
+                outputs.append([{'id': i, 'property': property_name} for i in pattern_outputs or []])
+            else:
+                outputs.append({'id': component_id, 'property': property_name})
+
+        payload = {
+            'output': output,
+            'outputs': outputs if output.startswith('..') else outputs[0],
+            'inputs': [prop(spec, v) for spec, v in zip(dependency['inputs'], inputs)],
+            'state': [prop(spec, v) for spec, v in zip(dependency['state'], state)],
+            'changedPropIds': changed or [],
+        }
+        start = time.perf_counter()
+        r = self.http.post(self.base_url + '/_dash-update-component', json=payload)
+        self.recorder.record(label, time.perf_counter() - start, r.status_code)
+        return r.json() if r.status_code == 200 else None
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = {}
+        self.errors = {}
+
+    def record(self, label, seconds, status):
+        with self._lock:
+            self.timings.setdefault(label, []).append(seconds)
+            # 204 is Dash's PreventUpdate, which is a normal outcome
+            if status not in (200, 204):
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+    def report(self, elapsed):
+        rows = []
+        for label, values in sorted(self.timings.items()):
+            ms = np.asarray(values) * 1000
+            rows.append((label, len(ms), self.errors.get(label, 0), *np.percentile(ms, [50, 95, 99]),
+                         len(ms) / elapsed))
+        width = max(len(row[0]) for row in rows) if rows else 10
+        lines = [f"{'callback':<{width}} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+                 f"{'req/s':>8}"]
+        for label, count, errors, p50, p95, p99, rate in rows:
+            lines.append(f"{label:<{width}} {count:>7} {errors:>7} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {rate:>8.1f}")
+        total = sum(len(v) for v in self.timings.values())
+        lines.append(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+        return '\n'.join(lines)
+
+
+def run_session(session, rng):
+    # Mirrors the callback sequence the browser fires while an analyst uses the dashboard
+    pathname = rng.choice(org_paths)
+    session.get('GET /', '/')
+    session.get('GET /_dash-layout', '/_dash-layout')
+    session.call('page-content.children', 'display_page', [pathname], changed=['url.pathname'])
+
+    response = session.call('..cluster-year-checklist.children...cluster-checklist.value..',
+                            'update_cluster_year_checklist', [pathname, None], [None], changed=['url.pathname'])
+    clusters = [0]
+    if response:
+        checklist = response['response']['cluster-year-checklist']['children']['props']['children'][1]
+        clusters = [option['value'] for option in checklist['props']['options']]
+
+    selected = [clusters[0]]
+    for step in range(3):
+        response = session.call('year-checklists.children', 'update_year_checklists',
+                                [selected, pathname, None], changed=['cluster-checklist.value'])
+        years = {}
+        if response:
+            for block in response['response']['year-checklists']['children']:
+                checklist = block['props']['children'][1]['props']
+                options = [option['value'] for option in checklist['options']]
+                years[checklist['id']['cluster']] = rng.sample(options, k=min(len(options), rng.randint(1, 4)))
+
+        year_values = [({'type': 'year-checklist', 'cluster': c}, years.get(c, [])) for c in selected]
+        response = session.call('selected-data.children', 'store_selected_data',
+                                [pathname, selected, year_values, None], changed=['cluster-checklist.value'])
+        if response:
+            selection = response['response']['selected-data']['children']
+            session.call('..bar-chart.figure...donut-chart.figure...area-chart.figure...line-chart.figure...'
+                         'roa-value.children...nav-value.children...pe-value.children...gauge-chart.figure..',
+                         'update_graphs', [selection, rng.choice([[], ['rolling'], ['rolling', 'band', 'yoy']])],
+                         changed=['selected-data.children'])
+
+        # Toggle a cluster on or off before the next round
+        toggled = rng.choice(clusters)
+        selected = sorted(set(selected) ^ {toggled}) or [toggled]
+
+    session.call('page-content.children', 'display_page', ['/predictions'], changed=['url.pathname'])
+    org = rng.choice(list(session.feature_counts))
+    session.call('feature-inputs.children', 'update_feature_inputs', [org], changed=['org-selector.value'])
+    session.call('decision-table-container.children', 'update_decision_table', [org],
+                 changed=['org-selector.value'])
+
+    ids = [{'type': 'feature-input', 'index': i} for i in range(session.feature_counts[org])]
+    values = [(i, round(rng.uniform(0, 30), 2)) for i in ids]
+    session.call('..prediction-output.children...{"index":["ALL"],"type":"feature-input"}.value..',
+                 'update_prediction', [1, None], [values, org, rng.choice([[], ['on']]), 10],
+                 changed=['predict-button.n_clicks'],
+                 pattern_outputs=ids)
+
+
+def start_server(kind, port, workers, threads):
+    if kind == 'gunicorn':
+        command = ['gunicorn', 'main:server', '--bind', f'127.0.0.1:{port}',
+                   '--workers', str(workers), '--threads', str(threads)]
+    else:
+        command = [sys.executable, '-c',
+                   f"from main import server; server.run(host='127.0.0.1', port={port}, threaded={threads > 1})"]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(300):
+        try:
+            requests.get(base_url + '/_dash-layout', timeout=1)
+            return process, base_url
+        except (requests.ConnectionError, requests.Timeout):
+            # Workers accept connections before they finish importing the app
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{kind} server did not start on port {port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay scripted dashboard sessions against a local server")
+    parser.add_argument('--url', help="Existing server to test, e.g. http://127.0.0.1:8050")
+    parser.add_argument('--serve', choices=['werkzeug', 'gunicorn'], default='werkzeug',
+                        help="Server to start when --url is not given")
+    parser.add_argument('--port', type=int, default=8051)
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument('--threads', type=int, default=4, help="Threads per worker")
+    parser.add_argument('--concurrency', type=int, default=8, help="Simultaneous simulated analysts")
+    parser.add_argument('--sessions', type=int, default=50, help="Total sessions to replay")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    process = None
+    base_url = args.url
+    if base_url is None:
+        process, base_url = start_server(args.serve, args.port, args.workers, args.threads)
+
+    try:
+        dependencies = {d['output']: d for d in requests.get(base_url + '/_dash-dependencies').json()}
+
+        from decision_tree import decision_tree_results, model_features
+        feature_counts = {org: len(model_features(r)) for org, r in decision_tree_results.items()}
+
+        recorder = Recorder()
+
+        def worker(i):
+            session = DashSession(base_url, dependencies, recorder, feature_counts)
+            run_session(session, random.Random(args.seed + i))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(worker, range(args.sessions)))
+        elapsed = time.perf_counter() - start
+
+        target = args.url or f"{args.serve} (workers={args.workers if args.serve == 'gunicorn' else 1}, " \
+                             f"threads={args.threads})"
+        print(f"Target: {target}, concurrency {args.concurrency}, {args.sessions} sessions\n")
+        print(recorder.report(elapsed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,3 @@
-import pandas as pd
 import plotly.graph_objs as go
 import dash
 from dash import dcc, html
@@ -8,92 +7,130 @@ import json
 from dash.exceptions import PreventUpdate
 import logging
 from decision_tree import *
+from data_loader import data_version, all_columns
+from storage import store
+from export import export_bp, export_links
+from api import api_bp
+from single_flight import single_flight, single_flight_stats
+from profiling import profiled, profiling_bp
+from shared_cache import shared_cache, shared_cache_stats
+from metrics import summary_metrics, card_text
+from analytics import ROLLING_WINDOW, ZSCORE_THRESHOLD, get_derived, derived_for
+from benchmarks import get_benchmarks
+from figure_encoding import encode_figure
 import openpyxl
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-# Loading data
-excel_file = 'Clusters_Data.xlsx'
-xls = pd.ExcelFile(excel_file)
-sheet_names = xls.sheet_names
-
-# Create a dictionary to store DataFrames for each organization
-dfs = {sheet: pd.read_excel(excel_file, sheet_name=sheet) for sheet in sheet_names}
 
 # Create the Dash app with a theme
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True,
                 assets_folder='assets')
+server = app.server
+
+app.server.register_blueprint(export_bp)
+app.server.register_blueprint(api_bp)
+app.server.register_blueprint(profiling_bp)
+
+
+@app.server.route('/metrics/single-flight')
+def single_flight_metrics():
+    # How many identical concurrent callback requests shared one computation
+    return single_flight_stats()
+
+
+@app.server.route('/metrics/cache')
+def shared_cache_metrics():
+    # Hit rates per tier for this worker; shared hits written by another worker show reuse across processes
+    return shared_cache_stats()
+
 
 org_order = ["African Overseas Enterprises", "Mr Price Group Ltd", "Rex Trueform Group Ltd", "The Foschini Group Ltd",
              "Truworths International Ltd"]
 
 
+# Columns update_graphs reads for a selection
+graph_columns = ['Year', 'Cluster', 'EarningsYield', 'DividendYield', 'ES', 'DividendShare', 'QuickRatio',
+                 'CurrentRatio', 'InflationAdjustedROE', 'DebtEquity', 'NAVShare', 'PriceEarnings',
+                 'InflationAdjustedReturn OnAssets']
+
+
 # Helper function to get unique clusters and years for each organization
-def get_clusters_and_years(df):
-    clusters = sorted(df['Cluster'].unique())
-    years = {cluster: sorted(df[df['Cluster'] == cluster]['Year'].unique()) for cluster in clusters}
-    return clusters, years
-
-
-ROA_card = dbc.Card(
-    [
-        dbc.CardBody(
-            [
-                html.H2("Return On Assets", className="card-title"),
-                html.H1(id="roa-value", className="card-value")
-            ],
-            id="ROA_dets"
-        ),
-        dbc.Tooltip([
-            "ROA shows the average return earned by all investors. The industry average ROA is 9.67 %, "
-            "a ROA above 9.67 % reflects efficiency in operations."
-        ], target="ROA_dets", placement="right", className="tooltip-custom"),
+def get_clusters_and_years(org):
+    return store.clusters_and_years(org)
 
-    ],
-    className='text-center mx-2 value-cards',
-    style={"height": "100px"}
-)
 
-NAV_card = dbc.Card(
-    [
-        dbc.CardBody(
-            [
-                html.H2("Net Asset Value/Share", className="card-title"),
-                html.H1(id="nav-value", className="card-value")
-            ],
-            id="NAV_det"),
-        dbc.Tooltip([
-            "The industry average NAV/share is R 3312.96."
-        ], target="nav-value", placement="right", className="tooltip-custom"),
-    ],
-    className='text-center mx-2 value-cards',
-    style={"height": "100px"}
-)
+def industry_benchmarks():
+    return get_benchmarks(store, data_version)['overall']
+
+
+def create_roa_card(industry):
+    return dbc.Card(
+        [
+            dbc.CardBody(
+                [
+                    html.H2("Return On Assets", className="card-title"),
+                    html.H1(id="roa-value", className="card-value")
+                ],
+                id="ROA_dets"
+            ),
+            dbc.Tooltip([
+                f"ROA shows the average return earned by all investors. The industry average ROA is "
+                f"{industry['roa']:.2f} %, a ROA above {industry['roa']:.2f} % reflects efficiency in operations."
+            ], target="ROA_dets", placement="right", className="tooltip-custom"),
+
+        ],
+        className='text-center mx-2 value-cards',
+        style={"height": "100px"}
+    )
+
+
+def create_nav_card(industry):
+    return dbc.Card(
+        [
+            dbc.CardBody(
+                [
+                    html.H2("Net Asset Value/Share", className="card-title"),
+                    html.H1(id="nav-value", className="card-value")
+                ],
+                id="NAV_det"),
+            dbc.Tooltip([
+                f"The industry average NAV/share is R {industry['nav']:.2f}."
+            ], target="nav-value", placement="right", className="tooltip-custom"),
+        ],
+        className='text-center mx-2 value-cards',
+        style={"height": "100px"}
+    )
+
+
+def create_pe_card(industry):
+    return dbc.Card(
+        [
+            dbc.CardBody(
+                [
+                    html.H2("Price/Earnings Ratio", className="card-title"),
+                    html.H1(id="pe-value", className="card-value")
+                ],
+                id="PE_dets"
+            ),
+            dbc.Tooltip([
+                "Price Earnings Ratio compares a company's share price to its Earnings per Share. A high P/E ratio shows "
+                "operational efficiency and is an indication of a good investment. The industry average "
+                f"Price Earnings ratio is {industry['pe']:.2f}."
+            ], target="PE_dets", placement="right", className="tooltip-custom"),
+        ],
+        className='text-center mx-2 value-cards',
+        style={"height": "100px"}
+    )
+
 
-PE_card = dbc.Card(
-    [
-        dbc.CardBody(
-            [
-                html.H2("Price/Earnings Ratio", className="card-title"),
-                html.H1(id="pe-value", className="card-value")
-            ],
-            id="PE_dets"
-        ),
-        dbc.Tooltip([
-            "Price Earnings Ratio compares a company's share price to its Earnings per Share. A high P/E ratio shows "
-            "operational efficiency and is an indication of a good investment. The industry average "
-            "Price Earnings ratio is R 411.82."
-        ], target="PE_dets", placement="right", className="tooltip-custom"),
-    ],
-    className='text-center mx-2 value-cards',
-    style={"height": "100px"}
-)
 navbar = dbc.NavbarSimple(
     children=[
         dbc.NavItem(dbc.NavLink("Home", href="/home", active="exact", className="nav-link-custom")),
         *[dbc.NavItem(dbc.NavLink(org, href=f"/{org.replace(' ', '-').replace('&', '').lower()}", active="exact",
                                   className="nav-link-custom")) for org in org_order],
+        dbc.NavItem(dbc.NavLink("Peer Comparison", href="/peers", active="exact", className="nav-link-custom")),
         dbc.NavItem(dbc.NavLink("Predictions", href="/predictions", active="exact", className="nav-link-custom")),
     ],
     brand=html.Span("Apparel Retail Industry", className="custom-brand"),
@@ -140,6 +177,8 @@ def display_page(pathname):
         return render_home_page()
     elif pathname == '/predictions':
         return render_predictions_page()
+    elif pathname == '/peers':
+        return render_peers_page()
     else:
         # Extract organization name from pathname
         org = pathname.strip('/').replace('-', ' ').replace('and', '&').title()
@@ -308,7 +347,27 @@ def render_predictions_page():
     )
 
 
+def render_peers_page():
+    metrics = [column for column in all_columns() if column not in ('Year', 'Cluster')]
+    return dbc.Card(
+        dbc.CardBody([
+            html.H2("Peer Comparison"),
+            html.Br(),
+            dbc.Row([
+                dbc.Col(dcc.Dropdown(
+                    id="peer-metric",
+                    options=[{"label": metric, "value": metric} for metric in metrics],
+                    value="InflationAdjustedROE",
+                    clearable=False
+                ), width=4)
+            ], className="mb-3"),
+            dcc.Graph(id="peer-chart")
+        ])
+    )
+
+
 def render_org_page(org):
+    industry = industry_benchmarks()
     return html.Div([
         dbc.Row([
             dbc.Col([
@@ -324,12 +383,33 @@ def render_org_page(org):
                     color="#17A2B8 ",
                     className="mt-3"
                 ),
+                dbc.DropdownMenu(
+                    [dbc.DropdownMenuItem(label, id=f"export-{fmt}", href="", external_link=True)
+                     for fmt, label in [('csv', "CSV"), ('xlsx', "Excel"), ('parquet', "Parquet")]],
+                    label="Download",
+                    color="custom",
+                    className="mt-3 ms-2"
+                ),
             ], width=2, className="d-flex align-items-end")
         ], className="mb-4 align-items-end"),
         dbc.Row([
-            dbc.Col(ROA_card, width={"size": 3, "offset": 1}),
-            dbc.Col(NAV_card, width=3),
-            dbc.Col(PE_card, width=3),
+            dbc.Col([
+                dbc.Label("Overlays:", className="label-style"),
+                dcc.Checklist(
+                    id='overlay-options',
+                    options=[{'label': f'{ROLLING_WINDOW}-year rolling mean', 'value': 'rolling'},
+                             {'label': 'Rolling std band (ROE)', 'value': 'band'},
+                             {'label': 'Year-over-year growth (ROE)', 'value': 'yoy'},
+                             {'label': f'Unusual years (ROE |z| ≥ {ZSCORE_THRESHOLD})', 'value': 'zscore'}],
+                    value=[],
+                    className="inline-checklist"
+                )
+            ], className="checklist-main")
+        ], className="mb-4"),
+        dbc.Row([
+            dbc.Col(create_roa_card(industry), width={"size": 3, "offset": 1}),
+            dbc.Col(create_nav_card(industry), width=3),
+            dbc.Col(create_pe_card(industry), width=3),
         ], justify="center", className="mb-4"),
         dbc.Row([
             dbc.Col(
@@ -342,12 +422,13 @@ def render_org_page(org):
                         dbc.Tooltip([
                             "Earnings Yield measures the return on the share price.",
                             html.Span("The Earnings Yield Industry Average"
-                                      " is 5.952.", style={"font-weight": "bold"}),
-                            "  An EY higher than 5.952 reflects above average returns on the share price.",
+                                      f" is {industry['earnings_yield']:.3f}.", style={"font-weight": "bold"}),
+                            f"  An EY higher than {industry['earnings_yield']:.3f} reflects above average returns "
+                            "on the share price.",
                             html.Br(),
                             html.Br(),
                             "Dividend Yield is  measure of final dividend on the share price.",
-                            html.Span(' The benchmark Dividend Yield is 3.178.',
+                            html.Span(f" The benchmark Dividend Yield is {industry['dividend_yield']:.3f}.",
                                       style={"font-weight": "bold"}),
                             ' A dividend yield higher than the benchmark '
                             'reflects a good '
@@ -384,8 +465,9 @@ def render_org_page(org):
                         dbc.Tooltip([
                             "Current and Quick ratio show how liquid an organisation is, that is how quickly the "
                             "organisation "
-                            "can convert assets into cash.", html.Span(' The benchmark for Current Ratio is 1.95 and '
-                                                                       '1.18 for Quick Ratio.',
+                            "can convert assets into cash.", html.Span(f" The benchmark for Current Ratio is "
+                                                                       f"{industry['current_ratio']:.2f} and "
+                                                                       f"{industry['quick_ratio']:.2f} for Quick Ratio.",
                                                                        style={
                                                                               "font-weight": "bold"})],
                             target="area_div", placement="right"),
@@ -403,7 +485,7 @@ def render_org_page(org):
                             "ROE measures an organisation's financial performance by measuring how efficiently "
                             "shareholders' "
                             "equity was turned into Net Income. A higher ROE shows efficient use equity. The Industry Average ROE "
-                            "is 10.94.", target="line_div", placement="right"),
+                            f"is {industry['roe']:.2f}.", target="line_div", placement="right"),
                     ]), style={"backgroundColor": "#f8f9fa"}
                 ), width=6
             ),
@@ -417,7 +499,8 @@ def render_org_page(org):
                             id='gauge_div'
                         ),
                         dbc.Tooltip("ROA measures the net income per asset employed. "
-                                    "Industry benchmark ROA is 19.72 %.", target="gauge_div", placement="right")
+                                    f"Industry benchmark ROA is {industry['raw_roa']:.2f} %.", target="gauge_div",
+                                    placement="right")
                     ]), style={"backgroundColor": "#f8f9fa"}
                 ), width=6,
             className="d-flex justify-content-center"
@@ -461,6 +544,7 @@ def update_active_tab(btn_aoe, btn_mrp, btn_rex, btn_tfg, btn_truworths, current
     Output("decision-table-container", "children"),
     Input("org-selector", "value")
 )
+@profiled()
 def update_decision_table(selected_org):
     if not selected_org:
         return html.Div("Select an organization to view its decision table")
@@ -475,6 +559,14 @@ def update_decision_table(selected_org):
     return create_decision_table_component(df)
 
 
+@app.callback(
+    Output("eps-threshold-tooltip", "children"),
+    Input("org-selector", "value")
+)
+def update_eps_threshold(selected_org):
+    return eps_threshold_text(selected_org)
+
+
 @app.callback(
     Output("feature-inputs", "children"),
     Input("org-selector", "value")
@@ -484,7 +576,7 @@ def update_feature_inputs(selected_org):
         return []
 
     org_data = decision_tree_results[selected_org]
-    features = list(org_data['feature_importance'].keys())
+    features = model_features(org_data)
 
     return dbc.Row([
         dbc.Col([
@@ -506,9 +598,12 @@ def update_feature_inputs(selected_org):
     [Input("predict-button", "n_clicks"),
      Input("reset-button", "n_clicks")],
     [State({"type": "feature-input", "index": ALL}, "value"),
-     State("org-selector", "value")]
+     State("org-selector", "value"),
+     State("uncertainty-mode", "value"),
+     State("uncertainty-noise", "value")]
 )
-def update_prediction(predict_clicks, reset_clicks, feature_values, selected_org):
+def update_prediction(predict_clicks, reset_clicks, feature_values, selected_org, uncertainty_mode=None,
+                      uncertainty_noise=None):
     ctx = dash.callback_context
     if not ctx.triggered:
         raise PreventUpdate
@@ -522,7 +617,7 @@ def update_prediction(predict_clicks, reset_clicks, feature_values, selected_org
         return f"No data found for {selected_org}", [dash.no_update] * len(feature_values)
 
     org_data = decision_tree_results[selected_org]
-    features = list(org_data['feature_importance'].keys())
+    features = model_features(org_data)
 
     if len(feature_values) != len(features) or any(v is None or v == '' for v in feature_values):
         return html.Div([
@@ -538,13 +633,152 @@ def update_prediction(predict_clicks, reset_clicks, feature_values, selected_org
                       style={'color': 'red', 'font-weight': 'bold'})
         ]), [dash.no_update] * len(feature_values)
 
-    tree = org_data['tree_structure']
-    prediction = predict_class(tree, dict(zip(features, feature_values)))
+    prediction = predict_eps(selected_org, feature_values)
 
-    return html.Div([
+    output = [
         html.Span(f"The predicted EPS value for {selected_org} is {prediction}ER than the Industry Average EPS",
                   style={'color': 'teal', 'font-weight': 'bold'})
-    ]), [dash.no_update] * len(feature_values)
+    ]
+    if uncertainty_mode and 'on' in uncertainty_mode:
+        output.append(create_uncertainty_summary(selected_org, dict(zip(features, feature_values)),
+                                                 uncertainty_noise))
+
+    return html.Div(output), [dash.no_update] * len(feature_values)
+
+
+def create_uncertainty_summary(selected_org, feature_values, noise_percent):
+    try:
+        noise = float(noise_percent) / 100
+    except (TypeError, ValueError):
+        noise = -1
+    if noise < 0:
+        return html.Div("Please enter a non-negative input noise percentage.",
+                        style={'color': 'red', 'font-weight': 'bold'}, className="mt-2")
+
+    result = monte_carlo_prediction(selected_org, feature_values, noise)
+    return html.Div([
+        html.P(f"With ±{noise * 100:g}% noise on each input, {result['p_high']:.1%} of {result['samples']:,} "
+               f"simulated inputs are predicted HIGH.", className="mb-1"),
+        dbc.Progress(value=result['p_high'] * 100, label=f"P(HIGH) {result['p_high']:.1%}", color="success",
+                     className="mb-2"),
+        html.P(f"Leaf-probability-weighted P(HIGH): {result['weighted_p_high']:.1%}. "
+               f"Confidence in {result['prediction']}: {result['confidence']:.1%}.", className="mb-0")
+    ], className="mt-2")
+
+
+@shared_cache('prediction', model_version)
+def predict_eps(selected_org, feature_values):
+    org_data = decision_tree_results[selected_org]
+    return predict_class(org_data['tree_structure'], dict(zip(model_features(org_data), feature_values)))
+
+
+@app.callback(
+    [Output("surface-x-feature", "options"),
+     Output("surface-x-feature", "value"),
+     Output("surface-y-feature", "options"),
+     Output("surface-y-feature", "value")],
+    [Input("org-selector", "value"),
+     Input("surface-x-feature", "value")],
+    [State("surface-y-feature", "value")]
+)
+def update_surface_features(selected_org, x_feature, y_feature):
+    if not selected_org or selected_org not in decision_tree_results:
+        return [], None, [], None
+
+    ctx = dash.callback_context
+    triggered_id = ctx.triggered[0]['prop_id'].split('.')[0] if ctx.triggered else None
+
+    org_data = decision_tree_results[selected_org]
+    ranked = ranked_surface_features(org_data)
+    # A new organisation starts on the features its tree actually splits on
+    if triggered_id != "surface-x-feature" or x_feature not in ranked:
+        x_feature, y_feature = ranked[0], None
+
+    # The y axis can never repeat the x feature
+    y_choices = [feature for feature in ranked if feature != x_feature]
+    if y_feature not in y_choices:
+        y_feature = y_choices[0] if y_choices else None
+
+    options = [{"label": feature, "value": feature} for feature in model_features(org_data)]
+    return options, x_feature, [option for option in options if option["value"] != x_feature], y_feature
+
+
+@app.callback(
+    Output("decision-surface", "figure"),
+    [Input("org-selector", "value"),
+     Input("surface-x-feature", "value"),
+     Input("surface-y-feature", "value"),
+     Input("predict-button", "n_clicks"),
+     Input("reset-button", "n_clicks")],
+    [State({"type": "feature-input", "index": ALL}, "value")]
+)
+def update_decision_surface(selected_org, x_feature, y_feature, predict_clicks, reset_clicks, feature_values):
+    if not selected_org or selected_org not in decision_tree_results or not x_feature or not y_feature:
+        return go.Figure()
+    if x_feature == y_feature:
+        raise PreventUpdate
+
+    ctx = dash.callback_context
+    triggered_id = ctx.triggered[0]['prop_id'].split('.')[0] if ctx.triggered else None
+
+    features = model_features(decision_tree_results[selected_org])
+    values = {}
+    if triggered_id != "reset-button":
+        for feature, value in zip(features, feature_values or []):
+            try:
+                values[feature] = float(value)
+            except (TypeError, ValueError):
+                continue
+
+    return create_decision_surface_figure(selected_org, x_feature, y_feature, values)
+
+
+@app.callback(
+    Output("peer-chart", "figure"),
+    Input("peer-metric", "value")
+)
+def update_peer_chart(metric):
+    if not metric or metric not in all_columns():
+        raise PreventUpdate
+
+    colors = ['#09124f', '#98BDFF', '#574476', '#17A2B8', '#2576A7', '#488A99', '#00CCCC', '#FF97FF', '#FECB52']
+
+    # One column per organisation, one row per year, straight from the stacked frame
+    values = store.long_frame([metric])[metric]
+    series = values.unstack('org')
+    industry = values.groupby(level='Year').mean()
+
+    fig = go.Figure()
+    for i, org in enumerate(series.columns):
+        fig.add_trace(go.Scatter(
+            x=series.index, y=series[org],
+            name=org,
+            mode='lines+markers',
+            line=dict(color=colors[i % len(colors)], width=2),
+            marker=dict(size=6)
+        ))
+    fig.add_trace(go.Scatter(
+        x=industry.index, y=industry,
+        name='Industry Average',
+        mode='lines',
+        line=dict(color='grey', width=2, dash='dash')
+    ))
+    fig.update_layout(
+        title={
+            'text': f'{metric} across the industry',
+            'y': 0.95,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top'
+        },
+        xaxis_title='Year',
+        yaxis_title=metric,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        template='plotly_white',
+        hovermode="x unified",
+        height=550
+    )
+    return fig
 
 
 # Add this function to create the reset button
@@ -561,7 +795,11 @@ def create_reset_button():
 def update_cluster_year_checklist(pathname, n_clicks, current_clusters):
     ctx = dash.callback_context
     triggered_id = ctx.triggered[0]['prop_id'].split('.')[0]
+    return build_cluster_year_checklist(pathname, triggered_id, current_clusters)
+
 
+@single_flight()
+def build_cluster_year_checklist(pathname, triggered_id, current_clusters):
     logger.info(f"Pathname: {pathname}")
 
     if pathname in ['/home', '/', '/predictions'] or pathname is None:
@@ -571,13 +809,12 @@ def update_cluster_year_checklist(pathname, n_clicks, current_clusters):
     try:
         selected_org = format_url_to_org(pathname)
 
-        if selected_org not in dfs:
+        if not store.has_org(selected_org):
             logger.warning(f"Organization not found: {selected_org}")
-            logger.info("Available organizations: %s", list(dfs.keys()))
+            logger.info("Available organizations: %s", store.orgs())
             return html.Div(f"Organization not found: {selected_org}", className="text-danger"), []
 
-        df = dfs[selected_org]
-        clusters, years = get_clusters_and_years(df)
+        clusters, years = get_clusters_and_years(selected_org)
 
         checklist = html.Div([
             dbc.Label("Select Clusters:", className="label-style"),
@@ -595,7 +832,7 @@ def update_cluster_year_checklist(pathname, n_clicks, current_clusters):
         else:
             return checklist, current_clusters or [0]
     except Exception as e:
-        logger.error(f"Error in update_cluster_year_checklist: {str(e)}")
+        logger.error(f"Error in build_cluster_year_checklist: {str(e)}")
         raise PreventUpdate
 
 
@@ -612,16 +849,15 @@ def update_year_checklists(selected_clusters, pathname, n_clicks):
     if triggered_id == 'btn-reset' or not selected_clusters or pathname in ['/home', '/about', '/']:
         return []
 
-    # Convert pathname to the format used in dfs keys
+    # Convert pathname to the format used for organisation names
     selected_org = pathname.strip('/').replace('-', ' ').replace('and', '&').title()
 
-    if selected_org not in dfs:
+    if not store.has_org(selected_org):
         print(f"Organization not found: {selected_org}")
-        print("Available organizations:", list(dfs.keys()))
+        print("Available organizations:", store.orgs())
         return html.Div(f"Organization not found: {selected_org}", className="text-danger")
 
-    df = dfs[selected_org]
-    clusters, years = get_clusters_and_years(df)
+    clusters, years = get_clusters_and_years(selected_org)
 
     year_checklists = []
     for cluster in selected_clusters:
@@ -687,6 +923,30 @@ def format_url_to_org(pathname):
     return org
 
 
+@app.callback(
+    [Output('export-csv', 'href'),
+     Output('export-xlsx', 'href'),
+     Output('export-parquet', 'href')],
+    [Input('selected-data', 'children')]
+)
+def update_export_links(json_data):
+    data = json.loads(json_data)
+    if data['org'] in ['home', 'predictions', '/']:
+        raise PreventUpdate
+
+    # Same selection update_graphs plots, but the export carries every column
+    selected_years = [year for years in data['years'].values() for year in years]
+    links = export_links(data['org'], data['clusters'], selected_years)
+    return links['csv'], links['xlsx'], links['parquet']
+
+
+def selection_key(json_data, overlays=None):
+    # Selections that filter to the same rows share a key, whatever order the boxes were ticked in
+    data = json.loads(json_data)
+    years = sorted({year for years in data['years'].values() for year in years})
+    return json.dumps([data['org'], sorted(data['clusters'] or []), years, sorted(overlays or [])])
+
+
 @app.callback(
     [Output('bar-chart', 'figure'),
      Output('donut-chart', 'figure'),
@@ -696,9 +956,13 @@ def format_url_to_org(pathname):
      Output('nav-value', 'children'),
      Output('pe-value', 'children'),
      Output('gauge-chart', 'figure')],
-    [Input('selected-data', 'children')]
+    [Input('selected-data', 'children'),
+     Input('overlay-options', 'value')]
 )
-def update_graphs(json_data):
+@single_flight(key=selection_key)
+@shared_cache('update_graphs', data_version, key=selection_key)
+@profiled()
+def update_graphs(json_data, overlays=None):
     data = json.loads(json_data)
     selected_org = data['org']
 
@@ -716,35 +980,26 @@ def update_graphs(json_data):
     selected_clusters = data['clusters']
     selected_years = [year for years in data['years'].values() for year in years]
 
-    print(f"Available organizations in dfs: {list(dfs.keys())}")
+    print(f"Available organizations: {store.orgs()}")
 
-    if selected_org in dfs:
-        df = dfs[selected_org]
+    if store.has_org(selected_org):
+        # Only the selected rows and the plotted columns are fetched
+        df = store.select(selected_org, graph_columns, selected_clusters, selected_years)
     else:
         print(f"No data found for organization: {selected_org}")
         empty_fig = go.Figure()
         return empty_fig, empty_fig, empty_fig, empty_fig, "", "", "", empty_fig
 
-    if selected_clusters:
-        df = df[df['Cluster'].isin(selected_clusters)]
-
-    if selected_years:
-        df = df[df['Year'].isin(selected_years)]
-
     # Define a common color scheme
     colors = ['#09124f', '#98BDFF', '#574476', '#17A2B8', '#2576A7', '#488A99', '#00CCCC', '#FF97FF', '#FECB52']
 
-    # Update ROA Card
-    roa_value = df['InflationAdjustedReturn OnAssets'].mean()
-    roa_card_content = f"{roa_value:.2f}%"
-
-    # Update NAV Card
-    nav_value = df['NAVShare'].mean()
-    nav_card_content = f" R {nav_value:.2f}"
+    summary = summary_metrics(df)
 
-    # Update PE Card
-    pe_value = df['PriceEarnings'].mean()
-    pe_card_content = f"{pe_value:.2f}"
+    # Update ROA, NAV and PE Cards
+    cards = card_text(summary)
+    roa_card_content = cards['roa']
+    nav_card_content = cards['nav_share']
+    pe_card_content = cards['price_earnings']
 
     # Bar Chart
     bar_fig = go.Figure()
@@ -769,8 +1024,8 @@ def update_graphs(json_data):
     )
 
     # Donut Chart
-    earnings_per_share = df['ES'].sum()
-    dividend_per_share = df['DividendShare'].sum()
+    earnings_per_share = summary['earnings_per_share_total']
+    dividend_per_share = summary['dividend_per_share_total']
     donut_fig = go.Figure(data=[go.Pie(
         labels=['Earnings per share', 'Dividend per share'],
         values=[earnings_per_share, dividend_per_share],
@@ -846,27 +1101,69 @@ def update_graphs(json_data):
         hovermode="x unified"
     )
 
+    # Rolling / year-over-year overlays, precomputed over each organisation's full history
+    if overlays and len(df):
+        derived = derived_for(get_derived(store, data_version), selected_org, df['Year'])
+        years = derived.index
+        rolling = derived['rolling_mean']
+
+        if 'rolling' in overlays:
+            for metric, label, color in [('EarningsYield', 'Earnings Yield', colors[0]),
+                                         ('DividendYield', 'Dividend Yield', colors[1])]:
+                bar_fig.add_trace(go.Scatter(x=years, y=rolling[metric], name=f'{label} ({ROLLING_WINDOW}y avg)',
+                                             mode='lines', line=dict(color=color, width=2, dash='dot')))
+            for metric, label, color in [('QuickRatio', 'Quick Ratio', colors[5]),
+                                         ('CurrentRatio', 'Current Ratio', colors[3])]:
+                area_fig.add_trace(go.Scatter(x=years, y=rolling[metric], name=f'{label} ({ROLLING_WINDOW}y avg)',
+                                              mode='lines', line=dict(color=color, width=2, dash='dot')))
+            line_fig.add_trace(go.Scatter(x=years, y=rolling['InflationAdjustedROE'],
+                                          name=f'ROE ({ROLLING_WINDOW}y avg)', mode='lines',
+                                          line=dict(color=colors[3], width=2, dash='dot')))
+
+        if 'band' in overlays:
+            spread = derived['rolling_std']['InflationAdjustedROE'].fillna(0)
+            line_fig.add_trace(go.Scatter(x=years, y=rolling['InflationAdjustedROE'] + spread, mode='lines',
+                                          line=dict(width=0), showlegend=False, hoverinfo='skip'))
+            line_fig.add_trace(go.Scatter(x=years, y=rolling['InflationAdjustedROE'] - spread, mode='lines',
+                                          line=dict(width=0), fill='tonexty', fillcolor='rgba(152, 189, 255, 0.3)',
+                                          name='Rolling ±1 std'))
+
+        if 'yoy' in overlays:
+            line_fig.add_trace(go.Bar(x=years, y=derived['yoy']['InflationAdjustedROE'] * 100, name='ROE YoY %',
+                                      marker_color=colors[7], opacity=0.5, yaxis='y2'))
+            line_fig.update_layout(yaxis2=dict(title='YoY %', overlaying='y', side='right', showgrid=False))
+
+        if 'zscore' in overlays:
+            # z-scores are within the year's cluster, so a flagged year is unusual for that phase
+            zscore = derived['zscore']['InflationAdjustedROE']
+            unusual = zscore.abs() >= ZSCORE_THRESHOLD
+            roe = df.drop_duplicates('Year').set_index('Year')['InflationAdjustedROE'].reindex(years)
+            line_fig.add_trace(go.Scatter(x=years[unusual], y=roe[unusual], customdata=zscore[unusual],
+                                          name=f'|z| ≥ {ZSCORE_THRESHOLD}', mode='markers',
+                                          marker=dict(color=colors[7], size=14, symbol='circle-open', line_width=3),
+                                          hovertemplate='z = %{customdata:.2f}<extra></extra>'))
+
     # Gauge Chart
-    debt_equity = df['DebtEquity'].mean()
+    debt_equity = summary['debt_equity']
     gauge_fig = go.Figure(go.Indicator(
         mode="gauge+number",
-        value=debt_equity,
+        value=debt_equity['mean'],
         title={
             'text': f'{selected_org}<br>Debt Equity Ratio',
             'font': {'size': 18}  # Adjust size as needed
         },
         domain={'y': [0, 1], 'x': [0, 1]},
         gauge={
-            'axis': {'range': [0, df['DebtEquity'].max()]},
+            'axis': {'range': [0, debt_equity['max']]},
             'bar': {'color': colors[3]},
             'steps': [
-                {'range': [0, df['DebtEquity'].mean()], 'color': "lightblue"},
-                {'range': [df['DebtEquity'].mean(), df['DebtEquity'].max()], 'color': colors[5]}
+                {'range': [0, debt_equity['mean']], 'color': "lightblue"},
+                {'range': [debt_equity['mean'], debt_equity['max']], 'color': colors[5]}
             ],
             'threshold': {
                 'line': {'color': colors[0], 'width': 4},
                 'thickness': 0.75,
-                'value': df['DebtEquity'].mean() + df['DebtEquity'].std()
+                'value': debt_equity['threshold']
             }
         }
     ))
@@ -878,7 +1175,9 @@ def update_graphs(json_data):
 
     )
 
-    return bar_fig, donut_fig, area_fig, line_fig, roa_card_content, nav_card_content, pe_card_content, gauge_fig
+    # Data arrays go to the browser as base64 typed arrays rather than JSON number lists
+    return (encode_figure(bar_fig), encode_figure(donut_fig), encode_figure(area_fig), encode_figure(line_fig),
+            roa_card_content, nav_card_content, pe_card_content, encode_figure(gauge_fig))
 
 
 # Run the app
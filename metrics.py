@@ -0,0 +1,60 @@
+import math
+
+import numpy as np
+
+
+# Per-year columns plotted on the org page
+series_columns = ['EarningsYield', 'DividendYield', 'QuickRatio', 'CurrentRatio', 'InflationAdjustedROE', 'DebtEquity']
+
+# Columns summary_metrics reads
+summary_columns = ['InflationAdjustedReturn OnAssets', 'NAVShare', 'PriceEarnings', 'ES', 'DividendShare', 'DebtEquity']
+
+
+def number(value):
+    # float32 values stay float32, so json_safe knows they only carry 7 significant digits
+    return value if isinstance(value, np.float32) else float(value)
+
+
+def summary_metrics(df):
+    # The aggregates behind the KPI cards, donut and gauge for one selection
+    debt_equity = df['DebtEquity']
+    return {
+        'roa': number(df['InflationAdjustedReturn OnAssets'].mean()),
+        'nav_share': number(df['NAVShare'].mean()),
+        'price_earnings': number(df['PriceEarnings'].mean()),
+        'earnings_per_share_total': number(df['ES'].sum()),
+        'dividend_per_share_total': number(df['DividendShare'].sum()),
+        'debt_equity': {
+            'mean': number(debt_equity.mean()),
+            'max': number(debt_equity.max()),
+            'std': number(debt_equity.std()),
+            'threshold': number(debt_equity.mean() + debt_equity.std()),
+        },
+    }
+
+
+def card_text(summary):
+    # What the ROA, NAV and P/E cards display for a selection
+    return {
+        'roa': f"{summary['roa']:.2f}%",
+        'nav_share': f" R {summary['nav_share']:.2f}",
+        'price_earnings': f"{summary['price_earnings']:.2f}",
+    }
+
+
+def json_safe(value):
+    # NaN (e.g. the std of a single year) and infinities are not valid JSON. Values from float32
+    # columns only carry 7 significant digits, so anything past that (1.8600000143) is noise
+    if isinstance(value, dict):
+        return {k: json_safe(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [json_safe(v) for v in value]
+    if isinstance(value, np.float32):
+        value = float(value)
+        return float(f"{value:.7g}") if math.isfinite(value) else None
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    return value
+
+
+__all__ = ['series_columns', 'summary_columns', 'number', 'summary_metrics', 'card_text', 'json_safe']
@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import time
+import random
+import pstats
+import logging
+import cProfile
+import itertools
+import threading
+import functools
+from collections import Counter
+
+from flask import Blueprint, request, jsonify, abort
+
+
+logger = logging.getLogger(__name__)
+
+# Off unless switched on here or through the admin route; the rate is the share of invocations profiled
+settings = {
+    'enabled': os.environ.get('DASH_PROFILE', '0') == '1',
+    'rate': float(os.environ.get('DASH_PROFILE_RATE', '0.1')),
+    'directory': os.environ.get('DASH_PROFILE_DIR', 'profiles'),
+    'keep': int(os.environ.get('DASH_PROFILE_KEEP', '100')),
+    'interval_ms': float(os.environ.get('DASH_PROFILE_INTERVAL_MS', '1')),
+}
+
+# Only one deterministic profiler can be attached at a time, so overlapping samples are skipped
+_active = threading.Lock()
+_written = Counter()
+# Numbers the profiles of this process, so two written within the same millisecond never share a name
+_sequence = itertools.count()
+
+
+class StackSampler:
+    # Polls one thread's stack on a timer and counts the collapsed call paths, which is what flamegraph tools read
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def input_size(args, kwargs):
+    # Bytes of the callback inputs as they arrived from the browser
+    return len(json.dumps([args, kwargs], default=str))
+
+
+def rotate(directory, keep):
+    # Each invocation writes a .pstats and a .folded file; drop the oldest pairs beyond the limit
+    files = sorted((entry for entry in os.scandir(directory) if entry.name.endswith(('.pstats', '.folded'))),
+                   key=lambda entry: entry.stat().st_mtime)
+    for entry in files[:max(len(files) - keep * 2, 0)]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def write_profile(name, size, elapsed, profile, sampler):
+    directory = settings['directory']
+    os.makedirs(directory, exist_ok=True)
+    now = time.time()
+    stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}{int(now % 1 * 1000):03d}"
+    stem = f"{stamp}-{os.getpid()}-{next(_sequence)}-{name}-{size}b-{elapsed * 1000:.0f}ms"
+    profile.dump_stats(os.path.join(directory, stem + '.pstats'))
+    with open(os.path.join(directory, stem + '.folded'), 'w') as f:
+        f.write(sampler.collapsed())
+    _written[name] += 1
+    rotate(directory, settings['keep'])
+    return stem
+
+
+def profiled(name=None):
+    def decorator(fn):
+        callback_id = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not settings['enabled'] or random.random() >= settings['rate'] or not _active.acquire(blocking=False):
+                return fn(*args, **kwargs)
+            try:
+                profile = cProfile.Profile()
+                sampler = StackSampler(threading.get_ident(), settings['interval_ms'] / 1000)
+                start = time.perf_counter()
+                with sampler:
+                    profile.enable()
+                    try:
+                        return fn(*args, **kwargs)
+                    finally:
+                        profile.disable()
+                        elapsed = time.perf_counter() - start
+            finally:
+                try:
+                    write_profile(callback_id, input_size(args, kwargs), elapsed, profile, sampler)
+                except OSError as e:
+                    logger.warning(f"Could not write profile for {callback_id}: {e}")
+                _active.release()
+
+        return wrapper
+
+    return decorator
+
+
+def top_functions(path, limit=20):
+    # Text summary of a saved profile, sorted by cumulative time
+    stats = pstats.Stats(path)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [{'function': f"{func[2]} ({os.path.basename(func[0])}:{func[1]})", 'calls': nc,
+             'total_s': round(tt, 6), 'cumulative_s': round(ct, 6)}
+            for func, (cc, nc, tt, ct, callers) in rows]
+
+
+profiling_bp = Blueprint('profiling', __name__, url_prefix='/admin/profiling')
+
+
+@profiling_bp.before_request
+def require_admin_token():
+    # The route is disabled unless an admin token is configured for this deployment
+    token = os.environ.get('DASH_ADMIN_TOKEN')
+    if not token or request.headers.get('X-Admin-Token') != token:
+        abort(403)
+
+
+def profiling_status():
+    directory = settings['directory']
+    files = sorted(e.name for e in os.scandir(directory) if e.name.endswith('.pstats')) \
+        if os.path.isdir(directory) else []
+    return {**settings, 'written': dict(_written), 'profiles': files}
+
+
+@profiling_bp.route('', methods=['GET'])
+def get_profiling():
+    return jsonify(profiling_status())
+
+
+@profiling_bp.route('', methods=['POST'])
+def set_profiling():
+    body = request.get_json(silent=True) or request.form
+    if 'enabled' in body:
+        settings['enabled'] = str(body['enabled']).lower() in ('1', 'true', 'on', 'yes')
+    if 'rate' in body:
+        try:
+            rate = float(body['rate'])
+        except ValueError:
+            abort(400, description="rate must be a number")
+        if not 0 <= rate <= 1:
+            abort(400, description="rate must be between 0 and 1")
+        settings['rate'] = rate
+    return jsonify(profiling_status())
+
+
+@profiling_bp.route('/<stem>')
+def show_profile(stem):
+    path = os.path.join(settings['directory'], os.path.basename(stem))
+    if not path.endswith('.pstats'):
+        path += '.pstats'
+    if not os.path.isfile(path):
+        abort(404)
+    return jsonify({'profile': os.path.basename(path), 'top': top_functions(path)})
+
+
+if __name__ == '__main__':
+    # python profiling.py <file.pstats> prints the hottest functions of a saved profile
+    for row in top_functions(sys.argv[1], limit=30):
+        print(f"{row['cumulative_s']:>10.4f}s {row['total_s']:>10.4f}s {row['calls']:>8}  {row['function']}")
+
+
+__all__ = ['profiled', 'profiling_bp', 'settings', 'StackSampler', 'top_functions']
@@ -0,0 +1,254 @@
+import os
+import time
+import json
+import pickle
+import sqlite3
+import hashlib
+import logging
+import threading
+import functools
+from collections import OrderedDict
+
+from single_flight import normalize_key
+from sqlite_pool import ThreadConnections
+
+
+logger = logging.getLogger(__name__)
+
+# One SQLite file shared by every worker on the host; the in-process tier sits in front of it
+cache_enabled = os.environ.get('DASHBOARD_CACHE', 'on') != 'off'
+cache_file = os.environ.get('DASHBOARD_CACHE_DB', 'cache.sqlite3')
+DEFAULT_TTL = float(os.environ.get('DASHBOARD_CACHE_TTL', '3600'))
+MAX_BYTES = int(float(os.environ.get('DASHBOARD_CACHE_MAX_MB', '256')) * 1024 * 1024)
+MEMORY_ENTRIES = int(os.environ.get('DASHBOARD_CACHE_MEMORY_ENTRIES', '256'))
+
+# Hits only bump last_access when it is older than this, so reads rarely need the write lock
+TOUCH_INTERVAL = 30
+
+_missing = object()
+
+
+class MemoryTier:
+    # Small per-process LRU with the same expiry as the shared tier
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _missing
+            value, expires = entry
+            if expires < time.time():
+                del self._entries[key]
+                return _missing
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires):
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SharedTier:
+    # Pickled results in SQLite; WAL lets workers read while one writes, and every write is one transaction
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._connections = ThreadConnections(self._open)
+        conn = self.connection()
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, name TEXT, value BLOB, '
+                         'size INTEGER, created REAL, expires REAL, last_access REAL, writer INTEGER)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_entries_last_access ON entries (last_access)')
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def connection(self):
+        return self._connections.get()
+
+    def get(self, key):
+        conn = self.connection()
+        now = time.time()
+        row = conn.execute('SELECT value, expires, last_access, writer FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] < now:
+            return _missing, None, None
+        if now - row[2] > TOUCH_INTERVAL:
+            conn.execute('UPDATE entries SET last_access = ? WHERE key = ?', (now, key))
+        return pickle.loads(row[0]), row[1], row[3]
+
+    def set(self, key, name, value, expires, exclusive=False):
+        # exclusive drops every other entry of the same name, e.g. one written by an earlier code version
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (key, name, blob, len(blob), now, expires, now, os.getpid()))
+            if exclusive:
+                conn.execute('DELETE FROM entries WHERE name = ? AND key != ?', (name, key))
+            conn.execute('DELETE FROM entries WHERE expires < ?', (now,))
+            # Keep the most recently used entries that fit in the size budget
+            conn.execute('DELETE FROM entries WHERE key IN (SELECT key FROM (SELECT key, SUM(size) OVER '
+                         '(ORDER BY last_access DESC, created DESC) AS running FROM entries) WHERE running > ?)',
+                         (self.max_bytes,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def usage(self):
+        count, size = self.connection().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {'entries': count, 'bytes': size, 'max_bytes': self.max_bytes}
+
+
+class TierStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, name, counter):
+        with self._lock:
+            counts = self.counts.setdefault(name, {'memory_hits': 0, 'shared_hits': 0, 'shared_hits_other_worker': 0,
+                                                   'misses': 0, 'errors': 0})
+            counts[counter] += 1
+
+    def report(self):
+        with self._lock:
+            report = {}
+            for name, counts in self.counts.items():
+                lookups = counts['memory_hits'] + counts['shared_hits'] + counts['misses']
+                # The shared tier is only consulted after a memory miss
+                shared_lookups = counts['shared_hits'] + counts['misses']
+                report[name] = {
+                    **counts,
+                    'memory_hit_rate': counts['memory_hits'] / lookups if lookups else None,
+                    'shared_hit_rate': counts['shared_hits'] / shared_lookups if shared_lookups else None,
+                }
+            return report
+
+
+_memory = MemoryTier(MEMORY_ENTRIES)
+_shared = None
+_shared_lock = threading.Lock()
+_stats = TierStats()
+
+
+def shared_tier():
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = SharedTier(cache_file, MAX_BYTES)
+    return _shared
+
+
+def source_version(directory=os.path.dirname(os.path.abspath(__file__))):
+    # Hash of the app's modules; cache.sqlite3 outlives restarts, and a deploy that changes how a result
+    # is built must not be served the payloads the previous code cached
+    h = hashlib.sha256()
+    for filename in sorted(f for f in os.listdir(directory) if f.endswith('.py')):
+        with open(os.path.join(directory, filename), 'rb') as f:
+            h.update(filename.encode() + b'\0' + f.read())
+    return h.hexdigest()[:16]
+
+
+code_version = source_version()
+
+
+def cache_key(name, version, normalized):
+    return hashlib.sha256(json.dumps([code_version, name, version, normalized]).encode()).hexdigest()
+
+
+def shared_cache(name, version, key=normalize_key, ttl=DEFAULT_TTL):
+    # version is the data or model version the result depends on, so a reload never serves stale results
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not cache_enabled:
+                return fn(*args, **kwargs)
+            k = cache_key(name, version, key(*args, **kwargs))
+
+            value = _memory.get(k)
+            if value is not _missing:
+                _stats.add(name, 'memory_hits')
+                return value
+
+            try:
+                value, expires, writer = shared_tier().get(k)
+            except Exception as e:
+                # The cache is an optimisation; a locked or corrupt store never fails the callback
+                logger.warning(f"Shared cache read failed for {name}: {e}")
+                _stats.add(name, 'errors')
+                value = _missing
+            if value is not _missing:
+                _stats.add(name, 'shared_hits')
+                if writer != os.getpid():
+                    _stats.add(name, 'shared_hits_other_worker')
+                _memory.set(k, value, expires)
+                return value
+
+            _stats.add(name, 'misses')
+            value = fn(*args, **kwargs)
+            expires = time.time() + ttl
+            _memory.set(k, value, expires)
+            try:
+                shared_tier().set(k, name, value, expires)
+            except Exception as e:
+                logger.warning(f"Shared cache write failed for {name}: {e}")
+                _stats.add(name, 'errors')
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def load_shared(name):
+    # A named value persisted in the shared tier, e.g. state a restarted worker builds on; None when absent
+    if not cache_enabled:
+        return None
+    try:
+        value = shared_tier().get(cache_key(name, None, None))[0]
+    except Exception as e:
+        logger.warning(f"Shared cache read failed for {name}: {e}")
+        return None
+    return None if value is _missing else value
+
+
+def save_shared(name, value, ttl=None):
+    # Without a ttl the value stays until it is replaced or evicted for space; it replaces the value
+    # saved under the same name by any earlier code version
+    if not cache_enabled:
+        return
+    expires = time.time() + ttl if ttl is not None else float('inf')
+    try:
+        shared_tier().set(cache_key(name, None, None), name, value, expires, exclusive=True)
+    except Exception as e:
+        logger.warning(f"Shared cache write failed for {name}: {e}")
+
+
+def shared_cache_stats():
+    report = {'pid': os.getpid(), 'enabled': cache_enabled, 'code_version': code_version, 'caches': _stats.report()}
+    if cache_enabled:
+        try:
+            report['shared'] = shared_tier().usage()
+        except sqlite3.Error as e:
+            report['shared'] = {'error': str(e)}
+    return report
+
+
+__all__ = ['shared_cache', 'shared_cache_stats', 'load_shared', 'save_shared', 'cache_key', 'code_version',
+           'MemoryTier', 'SharedTier']
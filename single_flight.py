@@ -0,0 +1,104 @@
+import json
+import threading
+import functools
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    # Concurrent calls with the same key wait for one in-progress computation and share its result
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.requests = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            self.requests += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn(*args, **kwargs)
+            except BaseException as e:
+                # Waiters see the same outcome, including PreventUpdate
+                call.error = e
+            finally:
+                # Only in-progress calls are shared; the next request after this computes afresh
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls),
+            }
+
+
+_groups = {}
+
+
+def normalize_key(*args, **kwargs):
+    # JSON strings are parsed first, so key order and whitespace differences don't split the key
+    def normalize(value):
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                return value
+        if isinstance(value, dict):
+            return {str(k): normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        return value
+
+    return json.dumps([normalize(list(args)), normalize(kwargs)], sort_keys=True, default=str)
+
+
+def single_flight(name=None, key=normalize_key):
+    def decorator(fn):
+        group = _groups.setdefault(name or fn.__name__, SingleFlight(name or fn.__name__))
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return group.do(key(*args, **kwargs), fn, *args, **kwargs)
+
+        wrapper.single_flight = group
+        return wrapper
+
+    return decorator
+
+
+def single_flight_stats():
+    return {name: group.stats() for name, group in _groups.items()}
+
+
+__all__ = ['SingleFlight', 'single_flight', 'single_flight_stats', 'normalize_key']
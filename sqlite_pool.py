@@ -0,0 +1,21 @@
+import os
+import threading
+
+
+class ThreadConnections:
+    # One SQLite connection per thread, reopened in forked worker processes; connect opens a new one
+
+    def __init__(self, connect):
+        self.connect = connect
+        self._local = threading.local()
+
+    def get(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self.connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+__all__ = ['ThreadConnections']
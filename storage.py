@@ -0,0 +1,160 @@
+import os
+import sqlite3
+import logging
+
+import pandas as pd
+
+from data_loader import (excel_file, storage_backend, dfs, data_version, compact_dtypes, get_columns, select_rows,
+                         build_long_frame, get_long_frame)
+from sqlite_pool import ThreadConnections
+
+
+logger = logging.getLogger(__name__)
+
+database_file = os.environ.get('DASHBOARD_DATABASE', 'ratios.sqlite3')
+
+
+class PandasStore:
+    # The loaded sheets as they are; fine for a handful of organisations
+
+    def __init__(self, frames):
+        self.frames = frames
+
+    def orgs(self):
+        return list(self.frames)
+
+    def has_org(self, org):
+        return org in self.frames
+
+    def clusters_and_years(self, org):
+        df = self.frames[org]
+        clusters = sorted(df['Cluster'].unique())
+        years = {cluster: sorted(df[df['Cluster'] == cluster]['Year'].unique()) for cluster in clusters}
+        return clusters, years
+
+    def select(self, org, columns, clusters=None, years=None):
+        df = get_columns(org, list(dict.fromkeys(['Cluster', 'Year'] + list(columns))))
+        return select_rows(df, clusters, years)[list(columns)]
+
+    def long_frame(self, columns):
+        # Every organisation stacked and indexed by (org, Year)
+        return get_long_frame(columns)
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def build_database(path=database_file, workbook=excel_file, version=data_version):
+    # Every column of every sheet in one table; written beside the target and swapped in, so
+    # workers starting together never read a half-built file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        xls = pd.ExcelFile(workbook)
+        for sheet in xls.sheet_names:
+            df = pd.read_excel(xls, sheet_name=sheet)
+            df.columns = df.columns.str.strip()
+            # A few cells are stored as text in the workbook; the table is numeric throughout
+            df = df.apply(pd.to_numeric, errors='coerce')
+            df.insert(0, 'org', sheet)
+            df.to_sql('ratios', conn, if_exists='append', index=False)
+        conn.execute('CREATE INDEX ix_ratios_org_cluster_year ON ratios (org, "Cluster", "Year")')
+        conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+        conn.execute("INSERT INTO meta VALUES ('data_version', ?)", (version,))
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    logger.info(f"Built {path} from {workbook} (data version {version})")
+
+
+def database_version(path):
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+
+class SQLiteStore:
+    # Fetches only the rows and columns a callback asks for, through the (org, Cluster, Year) index
+
+    def __init__(self, path=database_file, version=data_version):
+        if not os.path.exists(path) or database_version(path) != version:
+            build_database(path, version=version)
+        self.path = path
+        self._connections = ThreadConnections(lambda: sqlite3.connect(f"file:{path}?mode=ro", uri=True))
+        conn = self.connection()
+        self._orgs = [row[0] for row in conn.execute('SELECT DISTINCT org FROM ratios ORDER BY rowid')]
+        self._columns = [row[1] for row in conn.execute('PRAGMA table_info(ratios)')]
+
+    def connection(self):
+        return self._connections.get()
+
+    def orgs(self):
+        return list(self._orgs)
+
+    def has_org(self, org):
+        return org in self._orgs
+
+    def clusters_and_years(self, org):
+        rows = self.connection().execute(
+            'SELECT DISTINCT "Cluster", "Year" FROM ratios WHERE org = ? ORDER BY "Cluster", "Year"', (org,))
+        years = {}
+        for cluster, year in rows:
+            years.setdefault(int(cluster), []).append(int(year))
+        return sorted(years), years
+
+    def check_columns(self, columns):
+        unknown = [column for column in columns if column not in self._columns]
+        if unknown:
+            raise KeyError(f"Unknown columns: {unknown}")
+
+    def select(self, org, columns, clusters=None, years=None):
+        self.check_columns(columns)
+        sql = f"SELECT {', '.join(quote(c) for c in columns)} FROM ratios WHERE org = ?"
+        params = [org]
+        # Empty selections mean no filter, as in select_rows
+        if clusters:
+            sql += f' AND "Cluster" IN ({", ".join("?" * len(clusters))})'
+            params += [int(c) for c in clusters]
+        if years:
+            sql += f' AND "Year" IN ({", ".join("?" * len(years))})'
+            params += [int(y) for y in years]
+        # Workbook order, which is what the in-memory path returns
+        sql += ' ORDER BY rowid'
+        return compact_dtypes(pd.read_sql_query(sql, self.connection(), params=params))
+
+    def long_frame(self, columns):
+        # Built per organisation as the in-memory frame is, so both backends narrow the same columns
+        self.check_columns(columns)
+        wanted = list(dict.fromkeys(['Year', 'Cluster'] + list(columns)))
+        sql = f"SELECT org, {', '.join(quote(c) for c in wanted)} FROM ratios ORDER BY rowid"
+        df = pd.read_sql_query(sql, self.connection())
+        frames = {org: compact_dtypes(rows.drop(columns='org').reset_index(drop=True))
+                  for org, rows in df.groupby('org', sort=False)}
+        return build_long_frame({org: frames[org] for org in self._orgs})[list(columns)]
+
+
+def open_store(backend=storage_backend):
+    if backend == 'sqlite':
+        return SQLiteStore()
+    return PandasStore(dfs)
+
+
+store = open_store()
+logger.info(f"Serving {len(store.orgs())} organisations from the {storage_backend} store")
+
+
+if __name__ == '__main__':
+    # python storage.py rebuilds the database from the workbook
+    build_database()
+
+
+__all__ = ['storage_backend', 'database_file', 'PandasStore', 'SQLiteStore', 'build_database', 'open_store', 'store']
@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+
+from storage import store
+import analytics
+from analytics import derived_metrics, compute_derived, append_years, get_derived
+
+
+all_data = store.long_frame(['Cluster'] + derived_metrics)
+orgs = list(all_data.index.get_level_values('org').unique())
+
+
+class FrameStore:
+    def __init__(self, frame):
+        self.frame = frame
+
+    def long_frame(self, columns):
+        return self.frame[columns]
+
+
+def years_of(org):
+    return sorted(all_data.loc[org].index)
+
+
+@pytest.mark.parametrize('removed', [
+    # A year in the middle, so every window after it shifts
+    [(orgs[0], years_of(orgs[0])[len(years_of(orgs[0])) // 2])],
+    [(orgs[0], years_of(orgs[0])[0])],
+    [(orgs[0], years_of(orgs[0])[-1])],
+    [(orgs[0], years_of(orgs[0])[5]), (orgs[1], years_of(orgs[1])[10])],
+])
+def test_append_years_matches_full_recompute(removed):
+    new_index = pd.MultiIndex.from_tuples(removed, names=['org', 'Year'])
+    full = compute_derived(all_data)
+
+    appended = append_years(compute_derived(all_data.drop(new_index)), all_data, new_index)
+
+    pd.testing.assert_frame_equal(appended['series'], full['series'])
+    pd.testing.assert_frame_equal(appended['cagr'], full['cagr'])
+
+
+@pytest.fixture
+def shared(monkeypatch):
+    # Stands in for the shared cache tier, which outlives a worker restart
+    persisted = {}
+    monkeypatch.setattr(analytics, 'load_shared', persisted.get)
+    monkeypatch.setattr(analytics, 'save_shared', persisted.__setitem__)
+    monkeypatch.setattr(analytics, '_derived_cache', {})
+    return persisted
+
+
+def test_get_derived_extends_previous_version(shared, monkeypatch):
+    removed = pd.MultiIndex.from_tuples([(orgs[2], years_of(orgs[2])[-1])], names=['org', 'Year'])
+    get_derived(FrameStore(all_data.drop(removed)), 'before')
+
+    calls = []
+    monkeypatch.setattr(analytics, 'compute_derived', lambda *args: calls.append(args))
+    derived = get_derived(FrameStore(all_data), 'after')
+
+    assert not calls
+    pd.testing.assert_frame_equal(derived['series'], compute_derived(all_data)['series'])
+
+
+def test_get_derived_extends_persisted_series_after_restart(shared, monkeypatch):
+    removed = pd.MultiIndex.from_tuples([(orgs[0], years_of(orgs[0])[-1])], names=['org', 'Year'])
+    get_derived(FrameStore(all_data.drop(removed)), 'before')
+    monkeypatch.setattr(analytics, '_derived_cache', {})
+
+    calls = []
+    monkeypatch.setattr(analytics, 'compute_derived', lambda *args: calls.append(args))
+    derived = get_derived(FrameStore(all_data), 'after')
+
+    assert not calls
+    assert shared['derived_series'][0] == 'after'
+    pd.testing.assert_frame_equal(derived['series'], compute_derived(all_data)['series'])
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from train_decision_tree import build_results
+from decision_tree import model_classes, leaf_probabilities_vectorized
+
+
+params = {'criterion': 'gini', 'max_depth': 2, 'min_samples_split': 2, 'min_samples_leaf': 1, 'class_weight': None,
+          'ccp_alpha': 0.0}
+features = ['CurrentRatio', 'ReturnOnEquity', 'ProfitMargin']
+
+
+def p_high_of(labels):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(len(labels), len(features)))
+    results = build_results('Test', X, np.array(labels), features, params)
+    p_high, is_high = leaf_probabilities_vectorized(results['tree_structure'],
+                                                    {f: X[:, i] for i, f in enumerate(features)},
+                                                    model_classes(results))
+    return p_high, is_high
+
+
+@pytest.mark.parametrize('label, expected', [('LOW', 0.0), ('HIGH', 1.0)])
+def test_single_class_sheets(label, expected):
+    p_high, is_high = p_high_of([label] * 12)
+
+    assert np.all(p_high == expected)
+    assert np.all(is_high == (label == 'HIGH'))
+
+
+def test_leaf_probability_follows_the_predicted_class():
+    p_high, is_high = p_high_of(['HIGH', 'LOW'] * 6)
+
+    # argmax settles a 50/50 leaf on the first class, HIGH
+    assert np.all((p_high >= 0.5) == is_high)
@@ -0,0 +1,24 @@
+import pandas as pd
+import pytest
+
+from data_loader import excel_file, select_rows
+from storage import store
+from metrics import summary_columns, summary_metrics, card_text
+
+
+columns = ['Year', 'Cluster'] + summary_columns
+selections = [(org, cluster) for org in store.orgs() for cluster in [None] + store.clusters_and_years(org)[0]]
+
+
+def float64_frame(org):
+    # The sheet as pandas reads it, without any dtype narrowing
+    return pd.read_excel(excel_file, sheet_name=org)[columns].apply(pd.to_numeric, errors='coerce')
+
+
+@pytest.mark.parametrize('org, cluster', selections)
+def test_cards_match_float64(org, cluster):
+    clusters = [cluster] if cluster is not None else None
+
+    expected = card_text(summary_metrics(select_rows(float64_frame(org), clusters)))
+
+    assert card_text(summary_metrics(store.select(org, columns, clusters))) == expected
@@ -0,0 +1,226 @@
+import os
+import json
+import hashlib
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.model_selection import ParameterGrid, StratifiedKFold, cross_val_score
+from sklearn.metrics import accuracy_score, classification_report
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Raw ratios workbook and the file that remembers which sheets were already trained
+raw_data_file = 'Data.xlsx'
+manifest_file = 'training_manifest.json'
+
+# Data.xlsx uses short sheet names, the dashboard uses the full organisation names
+sheet_to_org = {
+    'AF': 'African Overseas Enterprises',
+    'Mr Price': 'Mr Price Group Ltd',
+    'Rex True': 'Rex Trueform Group Ltd',
+    'TFG': 'The Foschini Group Ltd',
+    'Truwths': 'Truworths International Ltd',
+}
+
+# EPS above the industry average is labelled HIGH, everything else LOW
+INDUSTRY_AVERAGE_EPS = 200.42
+target_column = 'ES'
+
+default_features = ['CurrentRatio', 'ReturnOnEquity', 'ProfitMargin']
+org_features = {
+    'Truworths International Ltd': ['CurrentRatio', 'InflationAdjustedROE', 'OperatingProfitMargin'],
+}
+
+# Feature names used in the results files that are named differently in the workbook
+column_aliases = {'ProfitMargin': 'NetProfitMargin'}
+
+param_grid = {
+    'criterion': ['gini', 'entropy'],
+    'max_depth': [2, 3, 4, None],
+    'min_samples_split': [2, 5, 10],
+    'min_samples_leaf': [1, 2, 4],
+    'class_weight': [None, 'balanced'],
+    'ccp_alpha': [0.0, 0.01],
+}
+
+
+def features_for(org):
+    return org_features.get(org, default_features)
+
+
+def load_training_frames(path=raw_data_file):
+    frames = {}
+    for sheet, df in pd.read_excel(path, sheet_name=None).items():
+        if sheet not in sheet_to_org:
+            continue
+        # Column headers in Data.xlsx carry stray newlines
+        df.columns = df.columns.str.strip()
+        frames[sheet_to_org[sheet]] = df
+    return frames
+
+
+def build_xy(org, df, eps_threshold=INDUSTRY_AVERAGE_EPS):
+    features = features_for(org)
+    columns = [column_aliases.get(feature, feature) for feature in features]
+    X = df[columns].to_numpy(dtype=np.float64)
+    y = np.where(df[target_column].to_numpy() > eps_threshold, 'HIGH', 'LOW')
+    return X, y, features
+
+
+def sheet_hash(org, df, eps_threshold=INDUSTRY_AVERAGE_EPS):
+    # The hash also covers the training configuration, so changing features or the grid retrains
+    h = hashlib.sha256()
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    h.update(json.dumps([features_for(org), param_grid, eps_threshold], sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def load_manifest(path=manifest_file):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(manifest, path=manifest_file):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def make_cv(y):
+    # Small sheets can have very few HIGH years, never ask for more folds than the minority class has
+    _, counts = np.unique(y, return_counts=True)
+    n_splits = int(max(2, min(5, counts.min()))) if len(counts) > 1 else 2
+    return StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
+
+
+def score_params(org, X, y, params):
+    clf = DecisionTreeClassifier(random_state=42, **params)
+    scores = cross_val_score(clf, X, y, cv=make_cv(y), scoring='accuracy')
+    return org, params, float(scores.mean())
+
+
+def export_tree(clf, feature_names):
+    tree = clf.tree_
+    classes = list(clf.classes_)
+
+    def build(node_id):
+        value = tree.value[node_id][0]
+        total = value.sum()
+        probabilities = [float(v / total) if total else 0.0 for v in value]
+        if tree.children_left[node_id] == tree.children_right[node_id]:
+            return {
+                'name': f"Leaf {node_id}",
+                'value': probabilities,
+                'class': classes[int(np.argmax(value))],
+                'samples': int(tree.n_node_samples[node_id]),
+            }
+        return {
+            'name': f"Node {node_id}",
+            'feature': feature_names[tree.feature[node_id]],
+            'threshold': float(tree.threshold[node_id]),
+            'left': build(tree.children_left[node_id]),
+            'right': build(tree.children_right[node_id]),
+            'samples': int(tree.n_node_samples[node_id]),
+        }
+
+    return build(0)
+
+
+def build_results(org, X, y, features, params, eps_threshold=INDUSTRY_AVERAGE_EPS):
+    clf = DecisionTreeClassifier(random_state=42, **params)
+    clf.fit(X, y)
+    predictions = clf.predict(X)
+
+    best_params = dict(params)
+    if best_params['class_weight'] == 'balanced':
+        # Store the resolved weights the same way the original results files do
+        classes, counts = np.unique(y, return_counts=True)
+        weights = len(y) / (len(classes) * counts)
+        best_params['class_weight'] = {str(i): float(w / weights[0]) for i, w in enumerate(weights)}
+
+    return {
+        'sheet_name': org,
+        'accuracy': float(accuracy_score(y, predictions)),
+        'classification_report': classification_report(y, predictions, output_dict=True, zero_division=0),
+        'best_params': best_params,
+        'feature_importance': {f: float(imp) for f, imp in zip(features, clf.feature_importances_)},
+        'tree_structure': export_tree(clf, features),
+        'max_depth': int(clf.get_depth()),
+        'pruned': bool(params['max_depth'] is not None or params['ccp_alpha'] > 0),
+        # The EPS the HIGH/LOW labels were drawn at, so the dashboard shows the average the model used
+        'eps_threshold': float(eps_threshold),
+        # Order of the probabilities in every leaf 'value'; a sheet with one label has a single class
+        'classes': [str(c) for c in clf.classes_],
+    }
+
+
+def write_results(org, results):
+    filename = f"{org}_results.json"
+    tmp = f"{filename}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(results, f, indent=4)
+    os.replace(tmp, filename)
+    return filename
+
+
+def train(path=raw_data_file, n_jobs=-1, force=False, eps_threshold=INDUSTRY_AVERAGE_EPS):
+    frames = load_training_frames(path)
+    manifest = load_manifest()
+
+    # Only organisations whose sheet content (or config) changed are retrained
+    stale = {}
+    for org, df in frames.items():
+        digest = sheet_hash(org, df, eps_threshold)
+        if force or manifest.get(org, {}).get('sheet_hash') != digest or not os.path.exists(f"{org}_results.json"):
+            stale[org] = digest
+        else:
+            logger.info(f"Skipping {org}: sheet unchanged")
+
+    if not stale:
+        logger.info("All results are up to date")
+        return []
+
+    data = {org: build_xy(org, frames[org], eps_threshold) for org in stale}
+
+    # One flat job list over every (organisation, parameter set) pair keeps all workers busy
+    grid = list(ParameterGrid(param_grid))
+    scores = Parallel(n_jobs=n_jobs)(
+        delayed(score_params)(org, data[org][0], data[org][1], params)
+        for org in stale for params in grid
+    )
+
+    best = {}
+    for org, params, score in scores:
+        if org not in best or score > best[org][1]:
+            best[org] = (params, score)
+
+    written = []
+    for org, (params, score) in best.items():
+        X, y, features = data[org]
+        results = build_results(org, X, y, features, params, eps_threshold)
+        written.append(write_results(org, results))
+        manifest[org] = {'sheet_hash': stale[org], 'cv_accuracy': score}
+        logger.info(f"Trained {org}: cv accuracy {score:.3f}, params {params}")
+
+    save_manifest(manifest)
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Retrain the EPS decision trees from Data.xlsx")
+    parser.add_argument('--data', default=raw_data_file)
+    parser.add_argument('--jobs', type=int, default=-1, help="Worker processes (-1 uses all cores)")
+    parser.add_argument('--force', action='store_true', help="Retrain every organisation")
+    parser.add_argument('--eps-threshold', type=float, default=INDUSTRY_AVERAGE_EPS)
+    args = parser.parse_args()
+    train(args.data, n_jobs=args.jobs, force=args.force, eps_threshold=args.eps_threshold)
@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+
+# Rows converted into the column arrays at a time
+BATCH_ROWS = 10000
+
+
+def to_float(values):
+    # Numbers pass straight through; text cells are parsed and anything unparseable becomes NaN
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+
+
+def read_sheet(path, sheet, columns=None, batch_rows=BATCH_ROWS):
+    # Read-only mode iterates rows straight from the sheet XML instead of building the cell object model
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet]
+        rows = ws.iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else '' for h in next(rows)]
+        wanted = [name for name in (columns or header) if name in header]
+        positions = [header.index(name) for name in wanted]
+
+        # max_row comes from the sheet's dimension record; grow the arrays if it was wrong
+        capacity = max((ws.max_row or 1) - 1, 1)
+        arrays = {name: np.empty(capacity, dtype=np.float64) for name in wanted}
+        n = 0
+        batch = []
+
+        def flush():
+            nonlocal capacity, n
+            if not batch:
+                return
+            if n + len(batch) > capacity:
+                capacity = max(capacity * 2, n + len(batch))
+                for name in wanted:
+                    arrays[name] = np.resize(arrays[name], capacity)
+            for name, pos in zip(wanted, positions):
+                arrays[name][n:n + len(batch)] = to_float([row[pos] for row in batch])
+            n += len(batch)
+            batch.clear()
+
+        for row in rows:
+            # Trailing blank rows are common in exported workbooks
+            if row is None or all(v is None for v in row):
+                continue
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                flush()
+        flush()
+    finally:
+        wb.close()
+
+    return sheet, {name: arrays[name][:n] for name in wanted}
+
+
+def iter_sheet(path, sheet, columns=None, batch_rows=BATCH_ROWS):
+    # Frames of at most batch_rows rows, so a caller never holds more of the sheet than one batch
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet].iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else '' for h in next(rows)]
+        wanted = [name for name in (columns or header) if name in header]
+        positions = [header.index(name) for name in wanted]
+
+        batch = []
+        for row in rows:
+            if row is None or all(v is None for v in row):
+                continue
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                yield pd.DataFrame({name: to_float([r[pos] for r in batch]) for name, pos in zip(wanted, positions)},
+                                   columns=wanted)
+                batch = []
+        if batch:
+            yield pd.DataFrame({name: to_float([r[pos] for r in batch]) for name, pos in zip(wanted, positions)},
+                               columns=wanted)
+    finally:
+        wb.close()
+
+
+def sheet_names_of(path):
+    wb = load_workbook(path, read_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def worker_count(sheets, max_workers=None):
+    return min(len(sheets), max_workers or os.cpu_count() or 1)
+
+
+def stream_workbook(path, columns=None, max_workers=None):
+    # One worker process per sheet, each holding only its own columns
+    sheets = sheet_names_of(path)
+    workers = worker_count(sheets, max_workers)
+    if workers <= 1:
+        results = [read_sheet(path, sheet, columns) for sheet in sheets]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(read_sheet, [path] * len(sheets), sheets, [columns] * len(sheets)))
+    frames = {sheet: pd.DataFrame(arrays) for sheet, arrays in results}
+    return sheets, frames
+
+
+_benchmark_script = """
+import os, sys, time, json, threading
+import pandas as pd
+from workbook_stream import stream_workbook, sheet_names_of, worker_count
+
+page = os.sysconf('SC_PAGE_SIZE')
+
+
+def tree_rss():
+    # Resident memory of this process plus every descendant, summed, read from /proc
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    total, pending = 0, [os.getpid()]
+    while pending:
+        pid = pending.pop()
+        pending += children.get(pid, [])
+        try:
+            with open(f'/proc/{pid}/statm') as f:
+                total += int(f.read().split()[1]) * page
+        except OSError:
+            pass
+    return total // 1024
+
+
+peak = baseline = tree_rss()
+done = threading.Event()
+
+
+def sample():
+    global peak
+    while not done.wait(0.02):
+        peak = max(peak, tree_rss())
+
+
+sampler = threading.Thread(target=sample, daemon=True)
+sampler.start()
+start = time.perf_counter()
+columns = json.loads(sys.argv[3])
+workers = json.loads(sys.argv[4])
+if sys.argv[1] == 'pandas':
+    xls = pd.ExcelFile(sys.argv[2])
+    frames = {s: pd.read_excel(xls, sheet_name=s, usecols=columns) for s in xls.sheet_names}
+    workers = 1
+else:
+    frames = stream_workbook(sys.argv[2], columns, max_workers=workers)[1]
+    workers = worker_count(sheet_names_of(sys.argv[2]), workers)
+elapsed = time.perf_counter() - start
+done.set()
+sampler.join()
+peak = max(peak, tree_rss())
+print(json.dumps({'workers': workers, 'elapsed_s': round(elapsed, 3), 'peak_rss_kb': peak,
+                  'load_rss_kb': peak - baseline, 'rows': sum(len(f) for f in frames.values())}))
+"""
+
+
+def ingestion_report(path, columns=None):
+    # Each loader runs in a fresh interpreter so peak RSS is not shared between them. Peaks are the summed
+    # RSS of the whole process tree, which counts pages forked workers still share once per process, so
+    # they are an upper bound; the single-worker streaming run gives the cost of one worker on its own
+    rows = []
+    for loader, workers in (('pandas', 1), ('streaming', None), ('streaming', 1)):
+        out = subprocess.run([sys.executable, '-c', _benchmark_script, loader, path, json.dumps(columns),
+                              json.dumps(workers)],
+                             capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        rows.append({'loader': loader, **json.loads(out.stdout.strip().splitlines()[-1])})
+    return pd.DataFrame(rows).set_index(['loader', 'workers'])
+
+
+__all__ = ['read_sheet', 'iter_sheet', 'stream_workbook', 'worker_count', 'ingestion_report', 'BATCH_ROWS']